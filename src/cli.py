@@ -5,13 +5,23 @@ FANZAモザイクツール CLIインターフェース
 """
 
 import click
+import functools
+import itertools
 import os
 import sys
 import yaml
 import logging
+import time
 from pathlib import Path
-from typing import List, Optional
-from .mosaic_processor import FanzaMosaicProcessor
+from typing import Callable, Iterable, Optional, Tuple, Union
+from .mosaic_processor import DEFAULT_PROFILE, PROFILES, FanzaMosaicProcessor, get_profile
+from .golden import DEFAULT_GOLDEN_DIR, DEFAULT_INPUT_DIR, run_golden
+from .metadata import probe_image
+from .progress import DEFAULT_REPORT_INTERVAL, REPORT_MODES, ProgressReporter
+from .planner import build_work_plan, format_work_plan
+from .triage import load_failures, retry_failure
+from .scheduler import BatchJob, BatchScheduler, JobResult, parse_size, plan_resources
+from .work_queue import DEFAULT_LEASE_TTL, LeaseQueue
 
 # ログ設定
 logging.basicConfig(
@@ -20,6 +30,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 他ノードの完了を待つ間のポーリング間隔（秒）
+QUEUE_POLL_INTERVAL = 5.0
+
+# detection の個別設定キー -> プロセッサの引数（指定時はプロファイルの値を上書き）
+DETECTION_OVERRIDES = {
+    'model_complexity': 'model_complexity',
+    'confidence': 'min_detection_confidence',
+    'visibility_threshold': 'visibility_threshold',
+    'max_image_size': 'max_image_size',
+}
+
+# retry の再検出設定（未指定時はプロファイルの閾値に倍率をかけて緩める）
+RETRY_MODEL_COMPLEXITY = 2
+RETRY_THRESHOLD_FACTOR = 0.5
+
 def load_config(config_path: Optional[str] = None) -> dict:
     """設定ファイルの読み込み"""
     default_config = {
@@ -29,9 +54,7 @@ def load_config(config_path: Optional[str] = None) -> dict:
             'blur_radius': 3
         },
         'detection': {
-            'confidence': 0.5,
-            'model_complexity': 1,
-            'max_image_size': 1024
+            'profile': DEFAULT_PROFILE
         },
         'output': {
             'format': 'png',
@@ -55,18 +78,47 @@ def load_config(config_path: Optional[str] = None) -> dict:
     
     return default_config
 
+def processor_options(config: dict) -> dict:
+    """
+    設定からプロセッサの引数を作成
+    detection の個別設定は指定されている場合のみプロファイルの値を上書きする
+    """
+    detection = config.get('detection', {})
+    options = {'profile': detection.get('profile', DEFAULT_PROFILE)}
+    for key, option in DETECTION_OVERRIDES.items():
+        options[option] = detection.get(key)
+    return options
+
 @click.group()
 @click.version_option(version="2.0.0")
 @click.option('--config', '-c', help='設定ファイルのパス')
 @click.option('--verbose', '-v', is_flag=True, help='詳細ログの出力')
+@click.option('--profile', type=click.Choice(list(PROFILES)),
+              help='エンジンプロファイル（設定ファイルの profile と個別の検出設定より優先）')
 @click.pass_context
-def cli(ctx, config, verbose):
+def cli(ctx, config, verbose, profile):
     """FANZA同人出版用モザイクツール CLI"""
     if verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
     ctx.ensure_object(dict)
     ctx.obj['config'] = load_config(config)
+    detection = ctx.obj['config']['detection']
+    if profile:
+        # 明示したプロファイルがそのまま使われるよう、設定ファイルの個別設定は無視する
+        ignored = [key for key in DETECTION_OVERRIDES if detection.pop(key, None) is not None]
+        if ignored:
+            logger.warning(f"--profile 指定のため設定ファイルの検出設定を無視: {', '.join(ignored)}")
+        detection['profile'] = profile
+    if detection.get('profile') not in PROFILES:
+        raise click.BadParameter(
+            f"不明なプロファイル: {detection.get('profile')}（{', '.join(PROFILES)}）",
+            param_hint="'detection.profile'"
+        )
+    overridden = {key: detection[key] for key in DETECTION_OVERRIDES if detection.get(key) is not None}
+    if overridden:
+        logger.warning(f"設定ファイルの検出設定でプロファイル {detection['profile']} の値を上書き: "
+                       f"{', '.join(f'{key}={value}' for key, value in overridden.items())}")
     
     logger.info("FANZAモザイクツール CLI 開始")
 
@@ -92,7 +144,7 @@ def process(ctx, input_path: str, output_path: str, mosaic_size: Optional[int],
             return
     
     # モザイク処理の実行
-    processor = FanzaMosaicProcessor()
+    processor = FanzaMosaicProcessor(**processor_options(config))
     try:
         logger.info(f"画像処理開始: {input_path}")
         
@@ -117,20 +169,67 @@ def process(ctx, input_path: str, output_path: str, mosaic_size: Optional[int],
     finally:
         processor.cleanup()
 
+def _run_batch_jobs(scheduler: BatchScheduler, jobs: Iterable[BatchJob],
+                    total: Union[int, Callable[[], int]],
+                    report_mode: str = 'text', report_interval: float = DEFAULT_REPORT_INTERVAL,
+                    on_result: Optional[Callable[[JobResult], None]] = None) -> Tuple[int, int]:
+    """スケジューラでジョブを処理し、(成功数, 失敗数) を返す"""
+    # ジョブが無ければ進捗表示も行わない（分散キューで確保できなかった巡回など）
+    job_iter = iter(jobs)
+    first_job = next(job_iter, None)
+    if first_job is None:
+        return 0, 0
+    jobs = itertools.chain([first_job], job_iter)
+    
+    with ProgressReporter(total, scheduler, report_mode, report_interval) as reporter:
+        for result in scheduler.run(jobs):
+            reporter.record(result)
+            if on_result:
+                on_result(result)
+            if result.error:
+                logger.error(f"処理エラー: {result.input_path} - {result.error}")
+            elif not result.success:
+                logger.warning(f"処理失敗: {result.input_path}")
+    
+    return reporter.succeeded, reporter.failed
+
+def _echo_queue_report(report: dict, err: bool = False):
+    """全ノードのマージ結果を表示"""
+    click.echo(f"\n📊 全ノード集計: 成功 {report['success']} / 失敗 {report['failed']}, "
+               f"{report['images_per_second']:.2f}枚/秒", err=err)
+    for node, stats in sorted(report['nodes'].items()):
+        click.echo(f"  {node}: 成功 {stats['success']} / 失敗 {stats['failed']}, "
+                   f"処理時間 {stats['busy_seconds']:.1f}秒", err=err)
+
 @cli.command()
 @click.argument('input_dir', type=click.Path(exists=True, file_okay=False))
 @click.argument('output_dir', type=click.Path())
 @click.option('--pattern', '-p', default='*.{jpg,jpeg,png}', help='ファイルパターン')
 @click.option('--recursive', '-r', is_flag=True, help='サブディレクトリも処理')
-@click.option('--parallel', '-j', default=1, help='並列処理数')
+@click.option('--parallel', '-j', default=1, help='並列処理数（0: CPU/メモリから自動決定）')
+@click.option('--memory-budget', '-m', help='メモリ予算（例: 4G, 512M）。省略時は上限の80%')
+@click.option('--plan', 'dry_run', is_flag=True, help='処理せずに作業計画と予測時間を表示')
+@click.option('--error-dir', '-e', type=click.Path(file_okay=False), help='失敗画像の保存先（retryで再処理）')
+@click.option('--queue', 'queue_dir', type=click.Path(file_okay=False),
+              help='共有ワークキューのディレクトリ（複数ノードで分散処理）')
+@click.option('--node-id', help='ワークキューでのノードID（省略時: ホスト名-PID）')
+@click.option('--lease-ttl', type=float, default=DEFAULT_LEASE_TTL, help='リースの有効期限（秒）')
+@click.option('--report', 'report_mode', type=click.Choice(REPORT_MODES), default='text',
+              help='進捗の表示形式（json: 定期的にJSON Linesを標準出力へ）')
+@click.option('--report-interval', type=float, default=DEFAULT_REPORT_INTERVAL, help='進捗の表示間隔（秒）')
 @click.option('--force', '-f', is_flag=True, help='既存ファイルの上書き')
 @click.pass_context
-def batch(ctx, input_dir: str, output_dir: str, pattern: str, recursive: bool, parallel: int, force: bool):
+def batch(ctx, input_dir: str, output_dir: str, pattern: str, recursive: bool, parallel: int,
+          memory_budget: Optional[str], dry_run: bool, error_dir: Optional[str],
+          queue_dir: Optional[str], node_id: Optional[str], lease_ttl: float,
+          report_mode: str, report_interval: float, force: bool):
     """複数画像の一括モザイク処理"""
     config = ctx.obj['config']
+    # JSONレポート時は標準出力をJSON Lines専用にし、メッセージは標準エラーへ
+    echo = functools.partial(click.echo, err=report_mode == 'json')
     
     # 出力ディレクトリの作成
-    if not os.path.exists(output_dir):
+    if not dry_run and not os.path.exists(output_dir):
         os.makedirs(output_dir)
         logger.info(f"出力ディレクトリを作成: {output_dir}")
     
@@ -142,45 +241,138 @@ def batch(ctx, input_dir: str, output_dir: str, pattern: str, recursive: bool, p
         files = list(input_path.glob(pattern))
     
     if not files:
-        click.echo(f"❌ 入力ディレクトリ {input_dir} に画像が見つかりません")
+        echo(f"❌ 入力ディレクトリ {input_dir} に画像が見つかりません")
         return
     
-    click.echo(f"📁 処理対象: {len(files)}ファイル")
+    echo(f"📁 処理対象: {len(files)}ファイル")
+    
+    # ジョブの作成
+    jobs = []
+    for file_path in files:
+        # 出力パスの生成
+        rel_path = file_path.relative_to(input_path)
+        output_path = Path(output_dir) / rel_path
+        output_path = output_path.with_suffix('.png')  # 出力形式を統一
+        
+        # 出力ディレクトリの作成
+        if not dry_run:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # 既存ファイルの確認
+        if output_path.exists() and not force:
+            continue
+        
+        # ヘッダーのみ読み取り（ピクセルはデコードしない）
+        jobs.append(BatchJob(file_path, output_path, probe_image(file_path)))
+    
+    # リソース計画
+    try:
+        budget = parse_size(memory_budget) if memory_budget else None
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--memory-budget')
+    plan = plan_resources(parallel, budget)
+    
+    # サイズ順の作業計画
+    work_plan = build_work_plan(jobs, plan)
+    for line in format_work_plan(work_plan):
+        echo(line)
+    
+    if dry_run:
+        return
     
     # バッチ処理の実行
-    processor = FanzaMosaicProcessor()
+    scheduler = BatchScheduler(plan, Path(error_dir) if error_dir else None, processor_options(config))
+    
+    if queue_dir:
+        # 共有キューからジョブを確保しながら処理し、他ノード分の完了まで待機
+        success_count = error_count = 0
+        with LeaseQueue(Path(queue_dir), node_id, lease_ttl) as queue:
+            echo(f"🌐 ワークキュー: {queue_dir} （ノード: {queue.node_id}）")
+            while True:
+                remaining = queue.pending(work_plan.jobs, input_path)
+                if remaining == 0:
+                    break
+                # 進捗の母数は今回確保した件数と、まだどのノードも確保していない件数の合計
+                # （ジョブは投入時に確保するため、確保済み件数だけでは残りが見えない）
+                claimed_before = queue.claimed_count
+                succeeded, failed = _run_batch_jobs(
+                    scheduler, queue.claim_jobs(work_plan.jobs, input_path),
+                    lambda: (queue.claimed_count - claimed_before
+                             + queue.unclaimed(work_plan.jobs, input_path)),
+                    report_mode, report_interval, on_result=queue.complete
+                )
+                success_count += succeeded
+                error_count += failed
+                if queue.pending(work_plan.jobs, input_path) > 0:
+                    logger.info("他ノードの処理完了を待機中")
+                    time.sleep(QUEUE_POLL_INTERVAL)
+            report = queue.merge_report()
+        _echo_queue_report(report, err=report_mode == 'json')
+    else:
+        success_count, error_count = _run_batch_jobs(scheduler, work_plan.jobs, len(work_plan.jobs),
+                                                     report_mode, report_interval)
+    
+    # 結果表示
+    echo(f"\n🎉 バッチ処理完了!")
+    echo(f"✅ 成功: {success_count}ファイル")
+    echo(f"❌ 失敗: {error_count}ファイル")
+    
+    if error_count > 0:
+        if error_dir:
+            echo(f"📂 失敗画像: {error_dir} （retry コマンドで再処理できます）")
+        sys.exit(1)
+
+@cli.command()
+@click.argument('error_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--model-complexity', type=click.IntRange(0, 2),
+              help=f'再検出時のモデル複雑度（省略時: {RETRY_MODEL_COMPLEXITY}）')
+@click.option('--confidence', type=float,
+              help=f'再検出時の検出信頼度（省略時: プロファイルの値 x {RETRY_THRESHOLD_FACTOR}）')
+@click.option('--visibility', type=float,
+              help=f'再検出時の腰ランドマーク可視度の閾値（省略時: プロファイルの値 x {RETRY_THRESHOLD_FACTOR}）')
+@click.pass_context
+def retry(ctx, error_dir: str, model_complexity: Optional[int], confidence: Optional[float],
+          visibility: Optional[float]):
+    """失敗画像のみを重い検出設定で再処理"""
+    config = ctx.obj['config']
+    failures = load_failures(Path(error_dir))
+    if not failures:
+        click.echo(f"✅ {error_dir} に再処理対象はありません")
+        return
+    
+    click.echo(f"📁 再処理対象: {len(failures)}ファイル")
+    
+    # 縮小画像で再検出し、検出できたものだけ元画像をデコードする
+    options = processor_options(config)
+    profile = get_profile(**options)
+    options.update(
+        model_complexity=RETRY_MODEL_COMPLEXITY if model_complexity is None else model_complexity,
+        min_detection_confidence=(profile.min_detection_confidence * RETRY_THRESHOLD_FACTOR
+                                  if confidence is None else confidence),
+        visibility_threshold=(profile.visibility_threshold * RETRY_THRESHOLD_FACTOR
+                              if visibility is None else visibility)
+    )
+    logger.info(f"再検出設定: モデル複雑度 {options['model_complexity']}, "
+                f"信頼度 {options['min_detection_confidence']}, "
+                f"可視度 {options['visibility_threshold']}")
+    processor = FanzaMosaicProcessor(**options)
     success_count = 0
     error_count = 0
     
     try:
-        with click.progressbar(files, label='処理中') as file_list:
-            for file_path in file_list:
-                # 出力パスの生成
-                rel_path = file_path.relative_to(input_path)
-                output_path = Path(output_dir) / rel_path
-                output_path = output_path.with_suffix('.png')  # 出力形式を統一
-                
-                # 出力ディレクトリの作成
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                # 既存ファイルの確認
-                if output_path.exists() and not force:
-                    continue
-                
-                # モザイク処理
+        with click.progressbar(failures, label='再処理中') as failure_list:
+            for record in failure_list:
                 try:
-                    success = processor.process_image(str(file_path), str(output_path))
-                    if success:
+                    if retry_failure(processor, record):
                         success_count += 1
                     else:
                         error_count += 1
-                        logger.warning(f"処理失敗: {file_path}")
+                        logger.warning(f"再処理失敗: {record.input_path} ({record.reason})")
                 except Exception as e:
                     error_count += 1
-                    logger.error(f"処理エラー: {file_path} - {e}")
+                    logger.error(f"再処理エラー: {record.input_path} - {e}")
         
-        # 結果表示
-        click.echo(f"\n🎉 バッチ処理完了!")
+        click.echo(f"\n🎉 再処理完了!")
         click.echo(f"✅ 成功: {success_count}ファイル")
         click.echo(f"❌ 失敗: {error_count}ファイル")
         
@@ -190,6 +382,50 @@ def batch(ctx, input_dir: str, output_dir: str, pattern: str, recursive: bool, p
     finally:
         processor.cleanup()
 
+@cli.command()
+@click.argument('queue_dir', type=click.Path(exists=True, file_okay=False))
+def report(queue_dir: str):
+    """分散バッチのワークキューから全ノードの結果を集計"""
+    _echo_queue_report(LeaseQueue(Path(queue_dir)).merge_report())
+
+@cli.command()
+@click.option('--profile', '-P', 'profiles', multiple=True, type=click.Choice(list(PROFILES)),
+              help='比較するプロファイル（省略時: 全プロファイル）')
+@click.option('--input-dir', type=click.Path(exists=True, file_okay=False), default=DEFAULT_INPUT_DIR,
+              help='入力画像のディレクトリ')
+@click.option('--golden-dir', type=click.Path(file_okay=False), default=DEFAULT_GOLDEN_DIR,
+              help='参照画像のディレクトリ')
+@click.option('--update', is_flag=True, help='現在の出力で参照画像を作り直す')
+def golden(profiles, input_dir: str, golden_dir: str, update: bool):
+    """
+    検出からモザイク適用までを通したゴールデン画像チェック（MediaPipeが必要）
+    検出結果はMediaPipeのバージョンに依存するため、参照画像は環境ごとに --update で作成する
+    モザイク適用のみの回帰テストは tests/test_golden.py
+    """
+    results = run_golden(profiles or list(PROFILES), Path(input_dir), Path(golden_dir), update)
+    
+    for result in results:
+        mark = '✅' if result.ok else '❌'
+        line = f"{mark} [{result.profile}] {result.name}: {result.status}"
+        if result.diff_pixels:
+            line += f" （差分 {result.diff_pixels}ピクセル, 最大 {result.max_diff}）"
+        if result.detail:
+            line += f" {result.detail}"
+        click.echo(line)
+    
+    failed = [result for result in results if not result.ok]
+    missing = [result for result in failed if result.status == 'missing']
+    if update:
+        click.echo(f"\n📝 参照画像を更新: {golden_dir}")
+    elif failed:
+        click.echo(f"\n❌ 不一致: {len(failed)}/{len(results)}")
+        if missing:
+            click.echo(f"💡 参照画像が無い画像が{len(missing)}件あります。"
+                       f"この環境の出力を基準にする場合は golden --update で作成してください")
+        sys.exit(1)
+    else:
+        click.echo(f"\n✅ 全{len(results)}件が一致")
+
 @cli.command()
 @click.argument('config_path', type=click.Path())
 @click.pass_context
@@ -0,0 +1,114 @@
+"""
+ゴールデン画像による等価性チェック
+入力画像をプロファイルごとに処理し、保存済みの参照画像とピクセル単位で比較する
+
+golden/<profile>/<name>.png     参照画像
+golden/<profile>/<name>.failed  検出失敗が期待される画像の目印
+"""
+
+import shutil
+import logging
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INPUT_DIR = 'input'
+DEFAULT_GOLDEN_DIR = 'golden'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+
+
+@dataclass
+class GoldenResult:
+    """1画像・1プロファイルの比較結果"""
+    profile: str
+    name: str
+    status: str  # match / mismatch / missing / updated
+    diff_pixels: int = 0
+    max_diff: int = 0
+    detail: str = ''
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ('match', 'updated')
+
+
+def _compare(actual_path: Path, reference_path: Path):
+    """(異なるピクセル数, 最大差分, 詳細) を返す"""
+    import cv2
+    import numpy as np
+
+    actual = cv2.imread(str(actual_path), cv2.IMREAD_UNCHANGED)
+    reference = cv2.imread(str(reference_path), cv2.IMREAD_UNCHANGED)
+    if actual.shape != reference.shape:
+        return actual.size, 255, f"サイズ不一致: {actual.shape} != {reference.shape}"
+
+    diff = cv2.absdiff(actual, reference)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    return int(np.count_nonzero(diff)), int(diff.max()), ''
+
+
+def _check_one(profile: str, image_path: Path, actual_path: Path, success: bool,
+               profile_dir: Path, update: bool) -> GoldenResult:
+    name = image_path.name
+    reference_path = profile_dir / f"{image_path.stem}.png"
+    failed_marker = profile_dir / f"{image_path.stem}.failed"
+
+    if update:
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        reference_path.unlink(missing_ok=True)
+        failed_marker.unlink(missing_ok=True)
+        if success:
+            shutil.copyfile(actual_path, reference_path)
+        else:
+            failed_marker.touch()
+        return GoldenResult(profile, name, 'updated', detail='' if success else '検出失敗を記録')
+
+    if not success:
+        if failed_marker.exists():
+            return GoldenResult(profile, name, 'match', detail='検出失敗（期待通り）')
+        if reference_path.exists():
+            return GoldenResult(profile, name, 'mismatch', detail='参照画像があるのに処理に失敗')
+        return GoldenResult(profile, name, 'missing', detail='参照画像がありません')
+
+    if failed_marker.exists():
+        return GoldenResult(profile, name, 'mismatch', detail='検出失敗が期待されるのに処理に成功')
+    if not reference_path.exists():
+        return GoldenResult(profile, name, 'missing', detail='参照画像がありません')
+
+    diff_pixels, max_diff, detail = _compare(actual_path, reference_path)
+    status = 'match' if diff_pixels == 0 else 'mismatch'
+    return GoldenResult(profile, name, status, diff_pixels, max_diff, detail)
+
+
+def run_golden(profiles: Iterable[str], input_dir: Path = Path(DEFAULT_INPUT_DIR),
+               golden_dir: Path = Path(DEFAULT_GOLDEN_DIR), update: bool = False) -> List[GoldenResult]:
+    """
+    入力画像をプロファイルごとに処理し、参照画像と比較
+    update=True の場合は現在の出力で参照画像を作り直す
+    """
+    from .mosaic_processor import FanzaMosaicProcessor
+
+    images = sorted(p for p in Path(input_dir).iterdir()
+                    if p.suffix.lower() in IMAGE_SUFFIXES)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for profile in profiles:
+            processor = FanzaMosaicProcessor(profile=profile)
+            try:
+                for image_path in images:
+                    actual_path = Path(tmp_dir) / profile / f"{image_path.stem}.png"
+                    actual_path.parent.mkdir(parents=True, exist_ok=True)
+                    success = processor.process_image(str(image_path), str(actual_path))
+                    result = _check_one(profile, image_path, actual_path, success,
+                                        Path(golden_dir) / profile, update)
+                    logger.debug(f"ゴールデン比較: {result}")
+                    results.append(result)
+            finally:
+                processor.cleanup()
+
+    return results
@@ -0,0 +1,110 @@
+"""
+画像ヘッダーのメタデータ取得
+ピクセルをデコードせずに寸法・形式・カラーモード・EXIF向きを読み取る
+"""
+
+import os
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# EXIF Orientation タグ
+EXIF_ORIENTATION_TAG = 0x0112
+# 90度回転を伴う Orientation 値（デコード後に幅と高さが入れ替わる）
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+# ヘッダー解析時にEXIFが読み込まれる形式（getexif() がピクセルをデコードしない）
+# PNGの getexif() は IDAT より前に eXIf が無いと load() するため含めない
+HEADER_EXIF_FORMATS = ('JPEG', 'MPO', 'TIFF', 'WEBP')
+# デコード画像に対する作業バッファの倍率（元画像・結果コピー・リサイズ/RGB変換）
+DECODE_OVERHEAD_FACTOR = 3
+
+
+@dataclass
+class ImageMetadata:
+    """画像ヘッダーから得られる情報"""
+    path: Path
+    width: int
+    height: int
+    format: str
+    mode: str
+    orientation: int = 1
+    file_size: int = 0
+
+    @property
+    def oriented_size(self):
+        """EXIF向き適用後の (幅, 高さ)。cv2.imread の結果と一致する"""
+        if self.orientation in _TRANSPOSED_ORIENTATIONS:
+            return self.height, self.width
+        return self.width, self.height
+
+    @property
+    def long_side(self) -> int:
+        return max(self.width, self.height)
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+    @property
+    def decoded_bytes(self) -> int:
+        """BGR 3チャンネルでデコードした際の作業メモリ推定"""
+        return self.pixels * 3 * DECODE_OVERHEAD_FACTOR
+
+
+def mosaic_size_for_dimensions(width: int, height: int) -> int:
+    """
+    FANZA規約に基づくモザイクサイズを寸法から計算
+    規約（1）: 画像長辺×1/100、最小4ピクセル
+    """
+    long_side = max(height, width)
+    if long_side < 400:
+        return 4  # 最小サイズ
+    return max(4, int(long_side / 100))
+
+
+def _read_orientation(img) -> int:
+    """ヘッダーから読めるEXIF向きのみ取得（load() を発生させない）"""
+    from PIL import Image
+
+    if img.format in HEADER_EXIF_FORMATS:
+        exif = img.getexif()
+    else:
+        raw = img.info.get('exif')
+        if not raw:
+            return 1
+        exif = Image.Exif()
+        exif.load(raw)
+    return int(exif.get(EXIF_ORIENTATION_TAG, 1))
+
+
+def probe_image(image_path: Path) -> Optional[ImageMetadata]:
+    """
+    画像ヘッダーを読み取りメタデータを返す
+    PILは遅延読み込みのため、load() を呼ばない限りピクセルはデコードされない
+    読み取れない場合はNone
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            orientation = 1
+            try:
+                orientation = _read_orientation(img)
+            except Exception:
+                pass
+            return ImageMetadata(
+                path=Path(image_path),
+                width=width,
+                height=height,
+                format=img.format or 'UNKNOWN',
+                mode=img.mode,
+                orientation=orientation,
+                file_size=os.path.getsize(image_path),
+            )
+    except Exception as e:
+        logger.warning(f"画像ヘッダーの読み込みに失敗: {image_path} - {e}")
+        return None
@@ -1,34 +1,229 @@
 import cv2
 import numpy as np
-import mediapipe as mp
-from PIL import Image
 import os
-from typing import Tuple, List, Optional
+from dataclasses import dataclass, replace
+from typing import Tuple, List, Optional, Union
 import logging
+from .metadata import mosaic_size_for_dimensions
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class EngineProfile:
+    """
+    デプロイ先ごとの速度/品質トレードオフ
+    margin_space: area_margin の座標系
+        'detection'（検出用の縮小画像のピクセル、元画像では倍率分大きくなる）/ 'original'（元画像のピクセル）
+    blur_mode: 'four_edge'（上下左右を段階的にぼかす）/ 'two_edge'（上下のみ簡易ぼかし）
+    """
+    name: str
+    model_complexity: int
+    min_detection_confidence: float
+    visibility_threshold: float
+    max_image_size: int
+    area_margin: int
+    margin_space: str
+    blur_mode: str
+
+
+PROFILES = {
+    # Render / CLI 向け: 標準モデル・4辺ぼかし
+    'render': EngineProfile(
+        name='render',
+        model_complexity=1,
+        min_detection_confidence=0.5,
+        visibility_threshold=0.5,
+        max_image_size=1024,
+        area_margin=20,
+        margin_space='detection',
+        blur_mode='four_edge',
+    ),
+    # Streamlit Cloud 向け: 最軽量モデル・低い閾値で検出率を優先・2辺ぼかし
+    'streamlit': EngineProfile(
+        name='streamlit',
+        model_complexity=0,
+        min_detection_confidence=0.2,
+        visibility_threshold=0.2,
+        max_image_size=800,
+        area_margin=25,
+        margin_space='original',
+        blur_mode='two_edge',
+    ),
+}
+DEFAULT_PROFILE = 'render'
+
+# 領域の頂点順 [左上, 右上, 右下, 左下] に対するマージンの向き
+_MARGIN_SIGNS = np.array([-1, 1, 1, -1])
+
+
+def get_profile(profile: Union[str, EngineProfile] = DEFAULT_PROFILE, **overrides) -> EngineProfile:
+    """
+    プロファイルを取得し、Noneでない指定値で上書き
+    """
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"不明なプロファイル: {profile}（{', '.join(PROFILES)}）")
+        profile = PROFILES[profile]
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    return replace(profile, **overrides) if overrides else profile
+
+
+def scale_areas(areas: List[np.ndarray], scale_factor: float, original_size: Tuple[int, int],
+                profile: EngineProfile) -> List[np.ndarray]:
+    """
+    縮小画像座標の領域を元の画像座標に戻す
+    縮小画像の下端は元画像の下端に合わせ、'original' 指定のマージンはここで加える
+    """
+    height = original_size[1]
+    thumbnail_height = int(height * scale_factor) if scale_factor != 1.0 else height
+    margin = profile.area_margin if profile.margin_space == 'original' else 0
+
+    scaled_areas = []
+    for area in areas:
+        scaled = area.copy() if scale_factor == 1.0 else (area / scale_factor).astype(np.int32)
+        # スケール戻しの切り捨てで最終行がモザイクから漏れないようにする
+        scaled[area[:, 1] >= thumbnail_height, 1] = height
+        scaled[:, 0] += _MARGIN_SIGNS * margin
+        scaled_areas.append(scaled)
+    return scaled_areas
+
+
+def apply_mosaic(image: np.ndarray, areas: List[np.ndarray], mosaic_size: int,
+                 blur_mode: str = 'four_edge') -> np.ndarray:
+    """
+    指定された領域にモザイクを適用
+    """
+    result_image = image.copy()
+    
+    for area in areas:
+        # 領域の境界を取得
+        x_coords = area[:, 0]
+        y_coords = area[:, 1]
+        
+        x_min, x_max = max(0, min(x_coords)), min(image.shape[1], max(x_coords))
+        y_min, y_max = max(0, min(y_coords)), min(image.shape[0], max(y_coords))
+        
+        if x_max <= x_min or y_max <= y_min:
+            continue
+        
+        # モザイク処理
+        region = result_image[y_min:y_max, x_min:x_max]
+        
+        # ピクセル化処理
+        small = cv2.resize(region, (mosaic_size, mosaic_size))
+        mosaic_region = cv2.resize(small, (x_max - x_min, y_max - y_min), 
+                                 interpolation=cv2.INTER_NEAREST)
+        
+        result_image[y_min:y_max, x_min:x_max] = mosaic_region
+        
+        # 境界線のぼかし処理
+        if blur_mode == 'two_edge':
+            blur_boundaries_simple(result_image, x_min, x_max, y_min, y_max)
+        else:
+            blur_boundaries_optimized(result_image, x_min, x_max, y_min, y_max, mosaic_size)
+    
+    return result_image
+
+
+def blur_boundaries_optimized(image: np.ndarray, x_min: int, x_max: int, 
+                              y_min: int, y_max: int, blur_size: int):
+    """
+    モザイク境界のぼかし処理（上下左右、Render環境最適化版）
+    """
+    blur_radius = max(2, min(blur_size // 3, 5))  # ぼかし強度を制限
+
+    # 境界周辺のぼかし（処理量を削減）
+    for i in range(1, blur_radius + 1):
+        # 上境界
+        if y_min - i >= 0:
+            cv2.GaussianBlur(image[y_min-i:y_min+i+1, x_min:x_max], 
+                            (3, 3), 0, 
+                            dst=image[y_min-i:y_min+i+1, x_min:x_max])
+
+        # 下境界
+        if y_max + i < image.shape[0]:
+            cv2.GaussianBlur(image[y_max-i:y_max+i+1, x_min:x_max], 
+                            (3, 3), 0, 
+                            dst=image[y_max-i:y_max+i+1, x_min:x_max])
+
+        # 左境界
+        if x_min - i >= 0:
+            cv2.GaussianBlur(image[y_min:y_max, x_min-i:x_min+i+1], 
+                            (3, 3), 0, 
+                            dst=image[y_min:y_max, x_min-i:x_min+i+1])
+
+        # 右境界
+        if x_max + i < image.shape[1]:
+            cv2.GaussianBlur(image[y_min:y_max, x_max-i:x_max+i+1], 
+                            (3, 3), 0, 
+                            dst=image[y_min:y_max, x_max-i:x_max+i+1])
+
+
+def blur_boundaries_simple(image: np.ndarray, x_min: int, x_max: int, 
+                           y_min: int, y_max: int):
+    """
+    モザイク境界の簡易ぼかし処理（上下境界のみ、Streamlit Cloud向け）
+    """
+    blur_radius = 3
+    kernel = (blur_radius * 2 + 1, blur_radius * 2 + 1)
+
+    # 上境界
+    if y_min - blur_radius >= 0:
+        cv2.GaussianBlur(image[y_min-blur_radius:y_min+blur_radius, x_min:x_max], 
+                        kernel, 0, 
+                        dst=image[y_min-blur_radius:y_min+blur_radius, x_min:x_max])
+
+    # 下境界
+    if y_max + blur_radius < image.shape[0]:
+        cv2.GaussianBlur(image[y_max-blur_radius:y_max+blur_radius, x_min:x_max], 
+                        kernel, 0, 
+                        dst=image[y_max-blur_radius:y_max+blur_radius, x_min:x_max])
+
+
 class FanzaMosaicProcessor:
     """
     FANZA隠蔽処理規約に準拠したモザイク処理エンジン
-    Render対応版
+    デプロイ先ごとの設定はプロファイル（PROFILES）で切り替える
     """
     
-    def __init__(self):
+    def __init__(self, profile: Union[str, EngineProfile] = DEFAULT_PROFILE,
+                 model_complexity: Optional[int] = None,
+                 min_detection_confidence: Optional[float] = None,
+                 visibility_threshold: Optional[float] = None,
+                 max_image_size: Optional[int] = None):
         """初期化"""
         # Render環境でのOpenCV設定
         os.environ['OPENCV_VIDEOIO_PRIORITY_MSMF'] = '0'
         
+        self.profile = get_profile(
+            profile,
+            model_complexity=model_complexity,
+            min_detection_confidence=min_detection_confidence,
+            visibility_threshold=visibility_threshold,
+            max_image_size=max_image_size
+        )
+        self.visibility_threshold = self.profile.visibility_threshold
+        self.max_image_size = self.profile.max_image_size
+        # 直近の検出に使った縮小画像とランドマーク（失敗時のトリアージ用）
+        self.last_detection: Optional[dict] = None
+        # 直近の process_image が失敗した段階（read_failed / no_detection / write_failed / error）
+        self.last_failure: Optional[str] = None
+        
+        # MediaPipeは検出にのみ必要なため、モザイク適用だけを使う場合は読み込まない
+        import mediapipe as mp
+        
         self.mp_pose = mp.solutions.pose
         self.mp_face_detection = mp.solutions.face_detection
         self.pose = self.mp_pose.Pose(
             static_image_mode=True,
-            model_complexity=1,  # Render環境での軽量化
+            model_complexity=self.profile.model_complexity,
             enable_segmentation=False,  # メモリ使用量削減
-            min_detection_confidence=0.5
+            min_detection_confidence=self.profile.min_detection_confidence
         )
+        logger.debug(f"エンジンプロファイル: {self.profile}")
         
     def calculate_mosaic_size(self, image: np.ndarray) -> int:
         """
@@ -36,73 +231,107 @@ class FanzaMosaicProcessor:
         規約（1）: 画像長辺×1/100、最小4ピクセル
         """
         height, width = image.shape[:2]
-        long_side = max(height, width)
-        
-        if long_side < 400:
-            return 4  # 最小サイズ
-        
-        mosaic_size = max(4, int(long_side / 100))
+        mosaic_size = mosaic_size_for_dimensions(width, height)
         logger.info(f"画像サイズ: {width}x{height}, モザイクサイズ: {mosaic_size}")
         return mosaic_size
     
+    def prepare_detection_image(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        検出用に画像を縮小
+        戻り値: (縮小画像, 元画像に対する倍率)
+        """
+        # 画像サイズの最適化（処理速度向上）
+        h, w = image.shape[:2]
+        limit = self.max_image_size
+        if h > limit or w > limit:
+            scale_factor = min(limit / h, limit / w)
+            new_h, new_w = int(h * scale_factor), int(w * scale_factor)
+            resized_image = cv2.resize(image, (new_w, new_h))
+            logger.info(f"画像をリサイズ: {w}x{h} -> {new_w}x{new_h}")
+            return resized_image, scale_factor
+        return image, 1.0
+    
+    def detect_in_thumbnail(self, thumbnail: np.ndarray) -> Tuple[List[np.ndarray], List[dict]]:
+        """
+        縮小画像上で性器領域を検出
+        戻り値: (縮小画像座標の領域リスト, ランドマーク一覧)
+        """
+        if self.pose is None:
+            logger.warning("MediaPipe Poseが初期化されていません")
+            return [], []
+        
+        # RGB変換（MediaPipeはRGBを要求）
+        rgb_image = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)
+        
+        # ポーズ検出
+        results = self.pose.process(rgb_image)
+        
+        if not results.pose_landmarks:
+            logger.warning("人体の検出に失敗しました")
+            return [], []
+        
+        landmarks = results.pose_landmarks.landmark
+        landmark_dump = [
+            {
+                'name': self.mp_pose.PoseLandmark(i).name,
+                'x': lm.x, 'y': lm.y, 'z': lm.z,
+                'visibility': lm.visibility
+            }
+            for i, lm in enumerate(landmarks)
+        ]
+        
+        # 性器領域の推定（腰周辺）
+        sensitive_areas = []
+        h_resized, w_resized = thumbnail.shape[:2]
+        
+        # 腰の位置を特定（MediaPipe Poseのインデックス）
+        left_hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP]
+        right_hip = landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP]
+        
+        threshold = self.visibility_threshold
+        if left_hip.visibility > threshold and right_hip.visibility > threshold:
+            # 腰周辺の矩形領域を作成
+            left_x = int(left_hip.x * w_resized)
+            right_x = int(right_hip.x * w_resized)
+            hip_y = int(left_hip.y * h_resized)
+            
+            # 性器領域の推定（腰から下）
+            # 元画像座標のマージンはスケール戻し後に scale_areas で加える
+            margin = self.profile.area_margin if self.profile.margin_space == 'detection' else 0
+            sensitive_areas.append(np.array([
+                [left_x - margin, hip_y],
+                [right_x + margin, hip_y],
+                [right_x + margin, h_resized],
+                [left_x - margin, h_resized]
+            ], dtype=np.int32))
+        
+        return sensitive_areas, landmark_dump
+    
+    def scale_areas(self, areas: List[np.ndarray], scale_factor: float,
+                    original_size: Tuple[int, int]) -> List[np.ndarray]:
+        """縮小画像座標の領域を元の画像座標（幅, 高さ）に戻す"""
+        return scale_areas(areas, scale_factor, original_size, self.profile)
+    
     def detect_sensitive_areas(self, image: np.ndarray) -> List[np.ndarray]:
         """
         MediaPipeを使用して性器領域を検出
-        Render環境最適化版
         """
         try:
-            # 画像サイズの最適化（Render環境での処理速度向上）
-            h, w = image.shape[:2]
-            if h > 1024 or w > 1024:
-                scale_factor = min(1024 / h, 1024 / w)
-                new_h, new_w = int(h * scale_factor), int(w * scale_factor)
-                resized_image = cv2.resize(image, (new_w, new_h))
-                logger.info(f"画像をリサイズ: {w}x{h} -> {new_w}x{new_h}")
-            else:
-                resized_image = image
-                scale_factor = 1.0
-            
-            # RGB変換（MediaPipeはRGBを要求）
-            rgb_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
-            
-            # ポーズ検出
-            results = self.pose.process(rgb_image)
+            resized_image, scale_factor = self.prepare_detection_image(image)
+            self.last_detection = {
+                'thumbnail': resized_image,
+                'scale': scale_factor,
+                'original_size': image.shape[1::-1],
+                'landmarks': []
+            }
             
-            if not results.pose_landmarks:
-                logger.warning("人体の検出に失敗しました")
-                return []
+            areas, landmark_dump = self.detect_in_thumbnail(resized_image)
+            self.last_detection['landmarks'] = landmark_dump
             
-            # 性器領域の推定（腰周辺）
-            sensitive_areas = []
-            
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                h_resized, w_resized = resized_image.shape[:2]
-                
-                # 腰の位置を特定（MediaPipe Poseのインデックス）
-                left_hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP]
-                right_hip = landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP]
-                
-                if left_hip.visibility > 0.5 and right_hip.visibility > 0.5:
-                    # 腰周辺の矩形領域を作成
-                    left_x = int(left_hip.x * w_resized)
-                    right_x = int(right_hip.x * w_resized)
-                    hip_y = int(left_hip.y * h_resized)
-                    
-                    # 性器領域の推定（腰から下）
-                    sensitive_area = np.array([
-                        [left_x - 20, hip_y],
-                        [right_x + 20, hip_y],
-                        [right_x + 20, h_resized],
-                        [left_x - 20, h_resized]
-                    ], dtype=np.int32)
-                    
-                    # 元の画像サイズにスケール戻し
-                    if scale_factor != 1.0:
-                        sensitive_area = (sensitive_area / scale_factor).astype(np.int32)
-                    
-                    sensitive_areas.append(sensitive_area)
-                    logger.info(f"性器領域を検出: {sensitive_area}")
+            # 元の画像サイズにスケール戻し
+            sensitive_areas = self.scale_areas(areas, scale_factor, image.shape[1::-1])
+            for area in sensitive_areas:
+                logger.info(f"性器領域を検出: {area}")
             
             return sensitive_areas
             
@@ -114,81 +343,23 @@ class FanzaMosaicProcessor:
                      mosaic_size: int) -> np.ndarray:
         """
         指定された領域にモザイクを適用
-        Render環境最適化版
-        """
-        result_image = image.copy()
-        
-        for area in areas:
-            # 領域の境界を取得
-            x_coords = area[:, 0]
-            y_coords = area[:, 1]
-            
-            x_min, x_max = max(0, min(x_coords)), min(image.shape[1], max(x_coords))
-            y_min, y_max = max(0, min(y_coords)), min(image.shape[0], max(y_coords))
-            
-            if x_max <= x_min or y_max <= y_min:
-                continue
-            
-            # モザイク処理
-            region = result_image[y_min:y_max, x_min:x_max]
-            
-            # ピクセル化処理
-            small = cv2.resize(region, (mosaic_size, mosaic_size))
-            mosaic_region = cv2.resize(small, (x_max - x_min, y_max - y_min), 
-                                     interpolation=cv2.INTER_NEAREST)
-            
-            result_image[y_min:y_max, x_min:x_max] = mosaic_region
-            
-            # 境界線のぼかし処理（軽量化版）
-            self._blur_boundaries_optimized(result_image, x_min, x_max, y_min, y_max, mosaic_size)
-        
-        return result_image
-    
-    def _blur_boundaries_optimized(self, image: np.ndarray, x_min: int, x_max: int, 
-                                  y_min: int, y_max: int, blur_size: int):
-        """
-        モザイク境界のぼかし処理（Render環境最適化版）
         """
-        blur_radius = max(2, min(blur_size // 3, 5))  # ぼかし強度を制限
-        
-        # 境界周辺のぼかし（処理量を削減）
-        for i in range(1, blur_radius + 1):
-            # 上境界
-            if y_min - i >= 0:
-                cv2.GaussianBlur(image[y_min-i:y_min+i+1, x_min:x_max], 
-                                (3, 3), 0, 
-                                dst=image[y_min-i:y_min+i+1, x_min:x_max])
-            
-            # 下境界
-            if y_max + i < image.shape[0]:
-                cv2.GaussianBlur(image[y_max-i:y_max+i+1, x_min:x_max], 
-                                (3, 3), 0, 
-                                dst=image[y_max-i:y_max+i+1, x_min:x_max])
-            
-            # 左境界
-            if x_min - i >= 0:
-                cv2.GaussianBlur(image[y_min:y_max, x_min-i:x_min+i+1], 
-                                (3, 3), 0, 
-                                dst=image[y_min:y_max, x_min-i:x_min+i+1])
-            
-            # 右境界
-            if x_max + i < image.shape[1]:
-                cv2.GaussianBlur(image[y_min:y_max, x_max-i:x_max+i+1], 
-                                (3, 3), 0, 
-                                dst=image[y_min:y_max, x_max-i:x_max+i+1])
+        return apply_mosaic(image, areas, mosaic_size, self.profile.blur_mode)
     
     def process_image(self, image_path: str, output_path: str) -> bool:
         """
         画像の完全処理（検出→モザイク→保存）
-        Render環境最適化版
         """
         try:
             logger.info(f"画像処理開始: {image_path}")
+            self.last_detection = None
+            self.last_failure = None
             
             # 画像読み込み
             image = cv2.imread(image_path)
             if image is None:
                 logger.error(f"画像の読み込みに失敗: {image_path}")
+                self.last_failure = 'read_failed'
                 return False
             
             # モザイクサイズ計算
@@ -199,6 +370,7 @@ class FanzaMosaicProcessor:
             
             if not sensitive_areas:
                 logger.warning("性器領域が検出できませんでした")
+                self.last_failure = 'no_detection'
                 return False
             
             # モザイク適用
@@ -211,15 +383,17 @@ class FanzaMosaicProcessor:
                 return True
             else:
                 logger.error(f"画像の保存に失敗: {output_path}")
+                self.last_failure = 'write_failed'
                 return False
             
         except Exception as e:
             logger.error(f"画像処理中にエラーが発生: {e}")
+            self.last_failure = 'error'
             return False
     
     def cleanup(self):
         """リソースのクリーンアップ"""
-        if hasattr(self, 'pose'):
+        if getattr(self, 'pose', None) is not None:
             self.pose.close()
         if hasattr(self, 'mp_pose'):
             self.mp_pose = None
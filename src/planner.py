@@ -0,0 +1,137 @@
+"""
+バッチ処理の作業計画
+ヘッダーのメタデータから処理順・サイズ別グループ・予測処理時間を求める
+"""
+
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List
+
+from .metadata import mosaic_size_for_dimensions
+from .scheduler import BatchJob, SchedulePlan, format_size
+
+logger = logging.getLogger(__name__)
+
+# 1枚あたりの処理時間モデル（秒）
+# 検出は max_image_size に縮小してから行うため寸法にほぼ依存しない固定分と、
+# デコード・モザイク・PNGエンコードの画素数比例分に分ける
+SECONDS_PER_IMAGE = 0.4
+SECONDS_PER_MEGAPIXEL = 0.05
+
+# 長辺によるサイズグループ（下限px, ラベル）
+SIZE_GROUPS = (
+    (4000, '4000px以上'),
+    (2000, '2000-3999px'),
+    (1000, '1000-1999px'),
+    (0, '1000px未満'),
+)
+
+
+@dataclass
+class SizeGroup:
+    """長辺サイズ別のジョブ集合"""
+    label: str
+    jobs: List[BatchJob] = field(default_factory=list)
+
+    @property
+    def pixels(self) -> int:
+        return sum(job.metadata.pixels for job in self.jobs)
+
+    @property
+    def mosaic_sizes(self) -> List[int]:
+        return sorted({mosaic_size_for_dimensions(*job.metadata.oriented_size)
+                       for job in self.jobs})
+
+
+@dataclass
+class WorkPlan:
+    """処理順に並べたジョブと計画情報"""
+    jobs: List[BatchJob]
+    groups: List[SizeGroup]
+    unreadable: List[BatchJob]
+    schedule: SchedulePlan
+    predicted_seconds: float
+
+    @property
+    def formats(self) -> Counter:
+        return Counter(f"{job.metadata.format}/{job.metadata.mode}"
+                       for job in self.jobs if job.metadata)
+
+
+def estimate_job_seconds(job: BatchJob) -> float:
+    """1枚あたりの予測処理時間"""
+    if job.metadata is None:
+        return SECONDS_PER_IMAGE
+    return SECONDS_PER_IMAGE + job.metadata.pixels / 1_000_000 * SECONDS_PER_MEGAPIXEL
+
+
+def _group_label(long_side: int) -> str:
+    for lower, label in SIZE_GROUPS:
+        if long_side >= lower:
+            return label
+    return SIZE_GROUPS[-1][1]
+
+
+def build_work_plan(jobs: List[BatchJob], schedule: SchedulePlan) -> WorkPlan:
+    """
+    ジョブを大きい画像から順に並べ、サイズ別にグループ化
+    大きい画像を先に投入することで、終盤に長時間の1枚だけが残るのを防ぐ
+    """
+    readable = [job for job in jobs if job.metadata is not None]
+    unreadable = [job for job in jobs if job.metadata is None]
+    readable.sort(key=lambda job: job.metadata.pixels, reverse=True)
+
+    groups = {label: SizeGroup(label) for _, label in SIZE_GROUPS}
+    for job in readable:
+        groups[_group_label(job.metadata.long_side)].jobs.append(job)
+
+    ordered = readable + unreadable
+    costs = [estimate_job_seconds(job) for job in ordered]
+    # 並列時は総処理時間の均等割りと最長の1枚のうち大きい方
+    predicted = max(sum(costs) / schedule.workers, max(costs, default=0.0))
+
+    return WorkPlan(
+        jobs=ordered,
+        groups=[groups[label] for _, label in SIZE_GROUPS if groups[label].jobs],
+        unreadable=unreadable,
+        schedule=schedule,
+        predicted_seconds=predicted,
+    )
+
+
+def format_work_plan(work_plan: WorkPlan) -> List[str]:
+    """作業計画を表示用の行に変換"""
+    lines = ["📋 作業計画"]
+    for group in work_plan.groups:
+        sizes = ', '.join(str(size) for size in group.mosaic_sizes)
+        lines.append(f"  {group.label}: {len(group.jobs)}ファイル, "
+                     f"{group.pixels / 1_000_000:.1f}MP, モザイクサイズ {sizes}px")
+    if work_plan.unreadable:
+        lines.append(f"  ヘッダー読み込み不可: {len(work_plan.unreadable)}ファイル")
+
+    formats = ', '.join(f"{name} x{count}" for name, count in sorted(work_plan.formats.items()))
+    if formats:
+        lines.append(f"  形式: {formats}")
+
+    rotated = sum(1 for job in work_plan.jobs if job.metadata and job.metadata.orientation != 1)
+    if rotated:
+        lines.append(f"  EXIF回転あり: {rotated}ファイル")
+
+    peak = max((job.metadata.decoded_bytes for job in work_plan.jobs if job.metadata), default=0)
+    schedule = work_plan.schedule
+    lines.append(f"  ワーカー: {schedule.workers} x {schedule.threads_label}スレッド, "
+                 f"メモリ予算: {format_size(schedule.memory_budget)}, "
+                 f"最大1枚: {format_size(peak)}")
+    lines.append(f"  予測処理時間: {_format_duration(work_plan.predicted_seconds)}")
+    return lines
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}時間{minutes}分{secs}秒"
+    if minutes:
+        return f"{minutes}分{secs}秒"
+    return f"{secs}秒"
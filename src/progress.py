@@ -0,0 +1,147 @@
+"""
+バッチ処理の進捗・スループット表示
+処理ループでは件数とバイト数の加算のみ行い、表示はバックグラウンドスレッドで定期的に行う
+"""
+
+import sys
+import json
+import time
+import threading
+from typing import Callable, Dict, Optional, TextIO, Union
+
+from .scheduler import BatchScheduler, JobResult
+
+REPORT_MODES = ('text', 'json')
+DEFAULT_REPORT_INTERVAL = 2.0
+
+
+class ProgressReporter:
+    """
+    images/sec・MB/sec・ETA・ステージ別キュー長・ワーカー稼働率の表示
+    text: 1行を上書き表示（端末以外では行単位）
+    json: 1行1オブジェクトのJSON Lines（ジョブダッシュボード向け）
+    """
+
+    def __init__(self, total: Union[int, Callable[[], int]], scheduler: BatchScheduler,
+                 mode: str = 'text', interval: float = DEFAULT_REPORT_INTERVAL,
+                 stream: Optional[TextIO] = None):
+        # 分散キューでは確保済み件数が増えていくため、件数を返す関数も受け付ける
+        self._total = total
+        self.scheduler = scheduler
+        self.mode = mode
+        self.interval = interval
+        if stream is None:
+            stream = sys.stdout if mode == 'json' else sys.stderr
+        self.stream = stream
+        self._overwrite = mode == 'text' and stream.isatty()
+
+        self.succeeded = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.worker_busy: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_time = 0.0
+
+    @property
+    def total(self) -> int:
+        return self._total() if callable(self._total) else self._total
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed
+
+    def record(self, result: JobResult):
+        """1件の完了を記録（処理ループから呼ばれる）"""
+        with self._lock:
+            if result.success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self.bytes_done += result.input_bytes
+            # ワーカーの異常終了など、ワーカーで処理されなかった結果は稼働率に含めない
+            if result.worker_pid:
+                self.worker_busy[result.worker_pid] = (
+                    self.worker_busy.get(result.worker_pid, 0.0) + result.elapsed
+                )
+
+    def snapshot(self) -> dict:
+        """現在の進捗とスループット"""
+        elapsed = max(time.perf_counter() - self._start_time, 1e-9)
+        with self._lock:
+            succeeded, failed = self.succeeded, self.failed
+            bytes_done = self.bytes_done
+            worker_busy = dict(self.worker_busy)
+        completed = succeeded + failed
+        rate = completed / elapsed
+        total = self.total
+        remaining = max(0, total - completed)
+
+        stats = self.scheduler.stats
+        pending = max(0, total - stats['submitted'])
+        queue = {
+            'pending': pending,
+            'memory_wait': min(stats['memory_wait'], pending),
+            'in_flight': stats['in_flight'],
+            'done': completed,
+        }
+        workers = {str(pid): min(1.0, busy / elapsed) for pid, busy in worker_busy.items()}
+
+        return {
+            'completed': completed,
+            'total': total,
+            'succeeded': succeeded,
+            'failed': failed,
+            'elapsed_seconds': elapsed,
+            'images_per_second': rate,
+            'mb_per_second': bytes_done / 1024 ** 2 / elapsed,
+            'eta_seconds': remaining / rate if rate > 0 else None,
+            'queue': queue,
+            'worker_utilisation': workers,
+        }
+
+    def _emit(self, event: str):
+        snapshot = self.snapshot()
+        if self.mode == 'json':
+            snapshot['event'] = event
+            snapshot['timestamp'] = time.time()
+            self.stream.write(json.dumps(snapshot, ensure_ascii=False) + '\n')
+        else:
+            line = self._format_text(snapshot)
+            if self._overwrite:
+                end = '\n' if event == 'summary' else ''
+                self.stream.write(f"\r\033[K{line}{end}")
+            else:
+                self.stream.write(line + '\n')
+        self.stream.flush()
+
+    @staticmethod
+    def _format_text(snapshot: dict) -> str:
+        eta = snapshot['eta_seconds']
+        eta_text = f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else '--:--'
+        queue = snapshot['queue']
+        utilisation = snapshot['worker_utilisation']
+        average = sum(utilisation.values()) / len(utilisation) if utilisation else 0.0
+        return (f"処理中 {snapshot['completed']}/{snapshot['total']} "
+                f"| {snapshot['images_per_second']:.2f}枚/秒 {snapshot['mb_per_second']:.1f}MB/秒 "
+                f"| ETA {eta_text} "
+                f"| 待機 {queue['pending']} メモリ待ち {queue['memory_wait']} 処理中 {queue['in_flight']} "
+                f"| 稼働率 {average:.0%}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._emit('progress')
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._emit('summary')
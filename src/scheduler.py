@@ -0,0 +1,505 @@
+"""
+バッチ処理用リソーススケジューラ
+cgroupのCPU/メモリ制限からワーカー数・スレッド数を決め、
+推定デコードサイズに基づいて画像の投入量を制御する
+"""
+
+import os
+import time
+import atexit
+import itertools
+import collections
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from .metadata import DECODE_OVERHEAD_FACTOR, ImageMetadata, probe_image
+from .triage import save_failure
+
+logger = logging.getLogger(__name__)
+
+# MediaPipe Pose + OpenCV ワーカー1つあたりの常駐メモリ見積もり
+WORKER_BASE_BYTES = 300 * 1024 * 1024
+# ヘッダーが読めない場合の圧縮率の仮定
+FALLBACK_COMPRESSION_RATIO = 10
+# 正常な結果を挟まずにワーカーが異常終了した場合のプール再起動の上限
+MAX_POOL_RESTARTS = 3
+# cgroup v1 で「無制限」を表す値の下限
+_CGROUP_V1_UNLIMITED = 1 << 60
+
+# ワーカー内部スレッド数を制御する環境変数（OpenMP/BLAS）
+# ライブラリの読み込み時に参照されるため、ワーカー起動前に親プロセスで設定する。
+# MediaPipe の TFLite(XNNPACK) はこれらを参照せず、Python API からも指定できない
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+)
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+@dataclass
+class ResourceLimits:
+    """実行環境で利用可能なリソース"""
+    cpu_count: int
+    memory_bytes: int
+
+
+@dataclass
+class SchedulePlan:
+    """ワーカー構成とメモリ予算"""
+    workers: int
+    threads_per_worker: int
+    memory_budget: int
+    cpu_count: int = 0
+
+    @property
+    def worker_threads(self) -> List[int]:
+        """ワーカーごとのスレッド数。CPU数の余りは先頭のワーカーに1つずつ配る"""
+        if self.cpu_count <= self.workers:
+            return [self.threads_per_worker] * self.workers
+        base, extra = divmod(self.cpu_count, self.workers)
+        return [base + 1] * extra + [base] * (self.workers - extra)
+
+    @property
+    def threads_label(self) -> str:
+        """表示用のスレッド数（ワーカー間で異なる場合は範囲）"""
+        threads = self.worker_threads
+        if min(threads) == max(threads):
+            return str(threads[0])
+        return f"{min(threads)}-{max(threads)}"
+
+    @property
+    def image_budget(self) -> int:
+        """ワーカー常駐分を除いた、画像デコード用のメモリ予算"""
+        return max(0, self.memory_budget - self.workers * WORKER_BASE_BYTES)
+
+
+@dataclass
+class BatchJob:
+    """バッチ処理の1単位"""
+    input_path: Path
+    output_path: Path
+    metadata: Optional[ImageMetadata] = None
+
+
+@dataclass
+class JobResult:
+    """ワーカーからの処理結果"""
+    input_path: str
+    output_path: str
+    success: bool
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    worker_pid: int = 0
+    input_bytes: int = 0
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """cgroupのCPUクォータ（コア数換算）。制限なしの場合はNone"""
+    # cgroup v2
+    cpu_max = _read_text('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        fields = cpu_max.split()
+        if len(fields) >= 2 and fields[0] != 'max':
+            try:
+                return int(fields[0]) / int(fields[1])
+            except (ValueError, ZeroDivisionError):
+                pass
+
+    # cgroup v1
+    quota = _read_text('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read_text('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period:
+        try:
+            quota_us, period_us = int(quota), int(period)
+            if quota_us > 0 and period_us > 0:
+                return quota_us / period_us
+        except ValueError:
+            pass
+
+    return None
+
+
+def _cgroup_memory_limit() -> Optional[int]:
+    """cgroupのメモリ上限（バイト）。制限なしの場合はNone"""
+    for path in ('/sys/fs/cgroup/memory.max',
+                 '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read_text(path)
+        if not value or value == 'max':
+            continue
+        try:
+            limit = int(value)
+        except ValueError:
+            continue
+        if 0 < limit < _CGROUP_V1_UNLIMITED:
+            return limit
+    return None
+
+
+def _physical_memory() -> Optional[int]:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def detect_resource_limits() -> ResourceLimits:
+    """
+    CPU/メモリの実効上限を検出
+    CPUアフィニティ・cgroupクォータ・物理メモリのうち最も厳しい値を採用
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpu_count = min(cpu_count, max(1, int(quota)))
+
+    candidates = [m for m in (_cgroup_memory_limit(), _physical_memory()) if m]
+    memory_bytes = min(candidates) if candidates else 2 * 1024 ** 3
+
+    limits = ResourceLimits(cpu_count=max(1, cpu_count), memory_bytes=memory_bytes)
+    logger.debug(f"リソース上限: CPU {limits.cpu_count}コア, メモリ {format_size(limits.memory_bytes)}")
+    return limits
+
+
+def parse_size(value: str) -> int:
+    """'512M', '2G', '1.5GiB' 形式のサイズ指定をバイト数に変換"""
+    text = value.strip().upper()
+    for suffix in ('IB', 'B'):
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+            break
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ''
+    number = text[:-1] if unit else text
+    try:
+        size = int(float(number) * _SIZE_UNITS[unit])
+    except (ValueError, OverflowError):
+        raise ValueError(f"サイズ指定が不正です: {value}")
+    if size <= 0:
+        raise ValueError(f"サイズは正の値で指定してください: {value}")
+    return size
+
+
+def format_size(size: float) -> str:
+    """バイト数を読みやすい単位に変換"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def estimate_decoded_bytes(job: BatchJob) -> int:
+    """
+    画像ヘッダーの寸法からデコード時のメモリ使用量を推定
+    ピクセルデータはデコードしない
+    """
+    metadata = job.metadata or probe_image(job.input_path)
+    if metadata is not None:
+        return metadata.decoded_bytes
+    try:
+        file_size = os.path.getsize(job.input_path)
+    except OSError:
+        return 0
+    return file_size * FALLBACK_COMPRESSION_RATIO * DECODE_OVERHEAD_FACTOR
+
+
+def plan_resources(requested_workers: int = 0, memory_budget: Optional[int] = None,
+                   limits: Optional[ResourceLimits] = None) -> SchedulePlan:
+    """
+    ワーカー数とワーカーあたりのスレッド数を決定
+    requested_workers が0以下の場合はCPU数とメモリ予算から自動決定
+    """
+    limits = limits or detect_resource_limits()
+    if memory_budget is None:
+        memory_budget = int(limits.memory_bytes * 0.8)
+
+    # ワーカー常駐分と同量を画像用に確保できる数まで
+    workers_by_memory = max(1, memory_budget // (2 * WORKER_BASE_BYTES))
+
+    if requested_workers > 0:
+        workers = requested_workers
+        if workers > limits.cpu_count:
+            logger.warning(f"並列数 {workers} がCPU数 {limits.cpu_count} を超えています")
+        if workers > workers_by_memory:
+            logger.warning(f"並列数 {workers} はメモリ予算 {format_size(memory_budget)} に対して過大です")
+    else:
+        workers = max(1, min(limits.cpu_count, workers_by_memory))
+
+    threads_per_worker = max(1, limits.cpu_count // workers)
+    plan = SchedulePlan(workers=workers, threads_per_worker=threads_per_worker,
+                        memory_budget=memory_budget, cpu_count=limits.cpu_count)
+    logger.info(f"スケジュール: ワーカー {plan.workers} x スレッド {plan.threads_label}, "
+                f"メモリ予算 {format_size(plan.memory_budget)}")
+    return plan
+
+
+def set_thread_env(threads: int):
+    """
+    OpenMP/BLAS のスレッド数を環境変数に設定
+    spawn したワーカーはこの環境を引き継ぎ、ライブラリ読み込み前から有効になる
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+
+def configure_threads(threads: int):
+    """OpenCVの内部スレッド数を設定（読み込み後でも有効）"""
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+
+# ワーカープロセス内で共有するプロセッサ
+_processor = None
+
+
+def _load_processor(threads: int, processor_options: Optional[dict] = None):
+    """スレッド数を固定してからプロセッサを生成"""
+    configure_threads(threads)
+    from .mosaic_processor import FanzaMosaicProcessor
+    return FanzaMosaicProcessor(**(processor_options or {}))
+
+
+def _init_worker(worker_threads: List[int], slot_counter, processor_options: Optional[dict] = None):
+    """ワーカープロセスの初期化: 起動順にスロットを取り、そのスレッド数を使う"""
+    global _processor
+    with slot_counter.get_lock():
+        slot = slot_counter.value
+        slot_counter.value += 1
+    _processor = _load_processor(worker_threads[slot % len(worker_threads)], processor_options)
+    atexit.register(_processor.cleanup)
+
+
+def _save_failure(error_dir: str, input_path: str, output_path: str, reason: str,
+                  detection: Optional[dict] = None):
+    """失敗画像をエラーディレクトリに保存（保存自体の失敗はログのみ）"""
+    try:
+        save_failure(Path(error_dir), input_path, output_path, reason, detection)
+    except Exception as e:
+        logger.error(f"失敗画像の保存に失敗: {input_path} - {e}")
+
+
+def _run_job(input_path: str, output_path: str, error_dir: Optional[str] = None) -> JobResult:
+    """ワーカー内で1枚を処理"""
+    start = time.perf_counter()
+    error = None
+    try:
+        success = _processor.process_image(input_path, output_path)
+    except Exception as e:
+        success = False
+        error = str(e)
+
+    if not success and error_dir:
+        # 縮小画像とランドマークはデコード済みのこのワーカーで保存する
+        reason = 'error' if error else (_processor.last_failure or 'error')
+        _save_failure(error_dir, input_path, output_path, reason, _processor.last_detection)
+
+    try:
+        input_bytes = os.path.getsize(input_path)
+    except OSError:
+        input_bytes = 0
+
+    return JobResult(input_path, output_path, success, error,
+                     time.perf_counter() - start, os.getpid(), input_bytes)
+
+
+class BatchScheduler:
+    """
+    メモリ予算内で画像を投入するバッチスケジューラ
+    同時処理中の推定デコードサイズの合計が予算を超えないように投入を待機する
+    """
+
+    def __init__(self, plan: SchedulePlan, error_dir: Optional[Path] = None,
+                 processor_options: Optional[dict] = None):
+        self.plan = plan
+        self.error_dir = str(error_dir) if error_dir else None
+        # FanzaMosaicProcessor の引数（プロファイルと上書き設定）
+        self.processor_options = processor_options or {}
+        # ステージ別の件数（進捗表示から参照）
+        # memory_wait: メモリ予算のために投入を待っているジョブ数（空きワーカー枠が上限）
+        self.stats = {'submitted': 0, 'memory_wait': 0, 'in_flight': 0}
+
+    # ワーカーの初期化関数と処理関数（spawn で渡すためモジュールレベルの関数）
+    worker_initializer = staticmethod(_init_worker)
+    job_runner = staticmethod(_run_job)
+
+    def run(self, jobs: Iterable[BatchJob]) -> Iterator[JobResult]:
+        """ジョブを処理し、完了順に結果を返す"""
+        # ジョブが無い場合はワーカーを起動しない（分散キューで他ノードが処理中の場合など）
+        job_iter = iter(jobs)
+        first_job = next(job_iter, None)
+        if first_job is None:
+            return
+        jobs = itertools.chain([first_job], job_iter)
+        self.stats = {'submitted': 0, 'memory_wait': 0, 'in_flight': 0}
+
+        if self.plan.workers == 1:
+            yield from self._run_inline(jobs)
+        else:
+            yield from self._run_pool(jobs)
+
+    def _run_inline(self, jobs: Iterable[BatchJob]) -> Iterator[JobResult]:
+        """単一ワーカー: プロセスを起動せずに全スレッドで処理"""
+        global _processor
+        _processor = _load_processor(self.plan.threads_per_worker, self.processor_options)
+        try:
+            for job in jobs:
+                self.stats['submitted'] += 1
+                self.stats['in_flight'] = 1
+                result = _run_job(str(job.input_path), str(job.output_path), self.error_dir)
+                self.stats['in_flight'] = 0
+                yield result
+        finally:
+            _processor.cleanup()
+            _processor = None
+
+    def _start_pool(self, context) -> ProcessPoolExecutor:
+        slot_counter = context.Value('i', 0)
+        return ProcessPoolExecutor(max_workers=self.plan.workers, mp_context=context,
+                                   initializer=self.worker_initializer,
+                                   initargs=(self.plan.worker_threads, slot_counter,
+                                             self.processor_options))
+
+    def _crashed_result(self, job: BatchJob, error: str) -> JobResult:
+        """ワーカーの異常終了で処理できなかったジョブの結果（親プロセスで保存する）"""
+        if self.error_dir:
+            _save_failure(self.error_dir, str(job.input_path), str(job.output_path), 'worker_crashed')
+        return JobResult(str(job.input_path), str(job.output_path), False, error)
+
+    def _run_pool(self, jobs: Iterable[BatchJob]) -> Iterator[JobResult]:
+        """
+        複数ワーカー: spawnしたプロセスでスレッド数を固定して処理
+        ワーカーが異常終了するとプール全体が使えなくなるため、プールを作り直して未完了のジョブを再投入する
+        """
+        image_budget = self.plan.image_budget
+        if image_budget == 0:
+            logger.warning("メモリ予算がワーカー常駐分に満たないため、1枚ずつ投入します")
+
+        # ワーカーは cv2/MediaPipe を初期化関数より前に読み込むため、環境変数は起動前に設定する。
+        # 環境変数は全ワーカー共通のため下限値とし、余りのコアは cv2.setNumThreads で配る
+        set_thread_env(self.plan.threads_per_worker)
+        context = multiprocessing.get_context('spawn')
+        job_iter = iter(jobs)
+        next_job, next_cost = None, 0
+        exhausted = False
+        # 異常終了時に処理中だったジョブ。原因を特定するため1枚ずつ再投入する
+        suspects = collections.deque()
+        # 正常な結果を挟まずに続いた異常終了の回数
+        crashes = 0
+
+        while True:
+            broken = False
+            with self._start_pool(context) as pool:
+                in_flight = {}
+                in_use = 0
+
+                while not broken:
+                    # メモリ予算とワーカー数の範囲で投入（疑わしいジョブがあれば単独で投入）
+                    limit = 1 if suspects else self.plan.workers
+                    while len(in_flight) < limit:
+                        if suspects:
+                            job = suspects.popleft()
+                            cost = estimate_decoded_bytes(job)
+                        else:
+                            if next_job is None:
+                                if exhausted:
+                                    break
+                                next_job = next(job_iter, None)
+                                if next_job is None:
+                                    exhausted = True
+                                    break
+                                next_cost = estimate_decoded_bytes(next_job)
+                                self.stats['submitted'] += 1
+                            # 予算超過でも、処理中が無ければ1枚は必ず投入する
+                            if in_flight and in_use + next_cost > image_budget:
+                                # 空いているワーカー枠の分だけジョブがメモリ待ちになっている
+                                self.stats['memory_wait'] = self.plan.workers - len(in_flight)
+                                break
+                            self.stats['memory_wait'] = 0
+                            job, cost, next_job = next_job, next_cost, None
+                        try:
+                            future = pool.submit(self.job_runner, str(job.input_path),
+                                                 str(job.output_path), self.error_dir)
+                        except BrokenProcessPool:
+                            suspects.appendleft(job)
+                            broken = True
+                            break
+                        in_flight[future] = (job, cost)
+                        in_use += cost
+
+                    self.stats['in_flight'] = len(in_flight)
+
+                    if not in_flight:
+                        break
+
+                    # 単独で処理中のジョブが異常終了した場合は、そのジョブが原因と判断できる
+                    alone = len(in_flight) == 1
+                    done, _ = wait(in_flight, return_when=ALL_COMPLETED if broken else FIRST_COMPLETED)
+                    crashed = []
+                    while done:
+                        for future in done:
+                            job, cost = in_flight.pop(future)
+                            in_use -= cost
+                            self.stats['in_flight'] = len(in_flight)
+                            try:
+                                result = future.result()
+                            except BrokenProcessPool:
+                                crashed.append(job)
+                                continue
+                            except Exception as e:
+                                logger.error(f"ワーカーエラー: {job.input_path} - {e}")
+                                if self.error_dir:
+                                    _save_failure(self.error_dir, str(job.input_path),
+                                                  str(job.output_path), 'error')
+                                yield JobResult(str(job.input_path), str(job.output_path),
+                                                False, str(e))
+                                continue
+                            crashes = 0
+                            yield result
+                        # 異常終了後は残りの処理中ジョブもすぐに失敗するため、全件を待つ
+                        done = wait(in_flight)[0] if crashed and in_flight else set()
+
+                    if crashed:
+                        broken = True
+                        if alone:
+                            logger.error(f"ワーカーが異常終了: {crashed[0].input_path}")
+                            yield self._crashed_result(crashed[0], 'ワーカーが異常終了しました')
+                        else:
+                            suspects.extend(crashed)
+
+                if not broken:
+                    return
+
+            crashes += 1
+            if crashes > MAX_POOL_RESTARTS:
+                logger.error(f"ワーカーの異常終了が{crashes}回続いたため、残りのジョブを失敗として扱います")
+                if next_job is not None:
+                    suspects.append(next_job)
+                for job in suspects:
+                    yield self._crashed_result(job, 'ワーカーの異常終了が続いたため未処理')
+                for job in job_iter:
+                    self.stats['submitted'] += 1
+                    yield self._crashed_result(job, 'ワーカーの異常終了が続いたため未処理')
+                self.stats['in_flight'] = 0
+                return
+            logger.warning(f"ワーカーが異常終了したため、プールを再起動します（{crashes}/{MAX_POOL_RESTARTS}）")
@@ -0,0 +1,143 @@
+"""
+処理失敗画像のトリアージ
+失敗した画像をエラーディレクトリに保存し、検出用の縮小画像を使って再処理する
+"""
+
+import json
+import shutil
+import hashlib
+import logging
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+FAILURE_FILE = 'failure.json'
+THUMBNAIL_FILE = 'thumbnail.png'
+LANDMARKS_FILE = 'landmarks.json'
+
+
+@dataclass
+class FailureRecord:
+    """エラーディレクトリに保存する失敗情報"""
+    input_path: str
+    output_path: str
+    reason: str
+    original_copy: str
+    thumbnail: Optional[str] = None
+    scale: float = 1.0
+    original_size: Optional[List[int]] = None
+    attempts: int = 1
+
+    @property
+    def entry_dir(self) -> Path:
+        return Path(self.original_copy).parent
+
+
+def _entry_name(input_path: str) -> str:
+    """同名ファイルが衝突しないよう、パスのハッシュを付けたディレクトリ名"""
+    digest = hashlib.sha1(str(Path(input_path).resolve()).encode('utf-8')).hexdigest()[:8]
+    return f"{Path(input_path).stem}_{digest}"
+
+
+def save_failure(error_dir: Path, input_path: str, output_path: str, reason: str,
+                 detection: Optional[dict] = None) -> FailureRecord:
+    """
+    失敗画像をエラーディレクトリに保存
+    元画像のコピー・検出用縮小画像・ランドマークを1ディレクトリにまとめる
+    """
+    import cv2
+
+    entry_dir = Path(error_dir) / _entry_name(input_path)
+    entry_dir.mkdir(parents=True, exist_ok=True)
+
+    original_copy = entry_dir / f"original{Path(input_path).suffix}"
+    if Path(input_path).exists():
+        shutil.copy2(input_path, original_copy)
+
+    record = FailureRecord(
+        input_path=str(input_path),
+        output_path=str(output_path),
+        reason=reason,
+        original_copy=str(original_copy),
+    )
+
+    if detection is not None:
+        thumbnail_path = entry_dir / THUMBNAIL_FILE
+        if cv2.imwrite(str(thumbnail_path), detection['thumbnail']):
+            record.thumbnail = str(thumbnail_path)
+        record.scale = detection['scale']
+        record.original_size = list(detection['original_size'])
+        with open(entry_dir / LANDMARKS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(detection['landmarks'], f, ensure_ascii=False, indent=2)
+
+    write_failure(record)
+    logger.info(f"失敗画像を保存: {input_path} -> {entry_dir}")
+    return record
+
+
+def write_failure(record: FailureRecord):
+    """失敗情報を書き込み"""
+    with open(record.entry_dir / FAILURE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(asdict(record), f, ensure_ascii=False, indent=2)
+
+
+def load_failures(error_dir: Path) -> List[FailureRecord]:
+    """エラーディレクトリから失敗情報を読み込み"""
+    records = []
+    for failure_file in sorted(Path(error_dir).glob(f"*/{FAILURE_FILE}")):
+        try:
+            with open(failure_file, 'r', encoding='utf-8') as f:
+                records.append(FailureRecord(**json.load(f)))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"失敗情報の読み込みに失敗: {failure_file} - {e}")
+    return records
+
+
+def retry_failure(processor, record: FailureRecord) -> bool:
+    """
+    保存済みの縮小画像で検出をやり直し、検出できた場合のみ元画像をデコードして処理
+    成功した場合はエラーディレクトリのエントリを削除
+    """
+    import cv2
+
+    record.attempts += 1
+
+    if record.thumbnail is None:
+        # 読み込み失敗など、縮小画像が無い場合は通常の処理
+        source = _source_path(record)
+        success = processor.process_image(source, record.output_path)
+    else:
+        thumbnail = cv2.imread(record.thumbnail)
+        areas, _ = processor.detect_in_thumbnail(thumbnail) if thumbnail is not None else ([], [])
+        if not areas:
+            record.reason = 'no_detection'
+            write_failure(record)
+            return False
+
+        image = cv2.imread(_source_path(record))
+        if image is None:
+            record.reason = 'read_failed'
+            write_failure(record)
+            return False
+
+        areas = processor.scale_areas(areas, record.scale, image.shape[1::-1])
+        mosaic_size = processor.calculate_mosaic_size(image)
+        result = processor.apply_mosaic(image, areas, mosaic_size)
+        Path(record.output_path).parent.mkdir(parents=True, exist_ok=True)
+        success = cv2.imwrite(record.output_path, result)
+
+    if success:
+        shutil.rmtree(record.entry_dir, ignore_errors=True)
+        logger.info(f"再処理成功: {record.input_path}")
+    else:
+        write_failure(record)
+    return success
+
+
+def _source_path(record: FailureRecord) -> str:
+    """元画像のパス（移動・削除されていればエラーディレクトリのコピー）"""
+    if Path(record.input_path).exists():
+        return record.input_path
+    return record.original_copy
@@ -0,0 +1,311 @@
+"""
+ファイルシステムベースの分散ワークキュー
+共有ファイルシステム上のリースファイルで、複数ノードの batch がジョブを取り合う
+
+queue_dir/
+├── leases/<item>.lease   処理中のジョブ（O_EXCLで作成、ハートビートでmtime更新）
+├── done/<item>.json      完了したジョブの結果
+└── report.json           全ノードの結果をマージしたレポート
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .scheduler import BatchJob, JobResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_TTL = 600.0
+LEASE_SUFFIX = '.lease'
+
+
+def default_node_id() -> str:
+    """ホスト名とPIDからノードIDを生成"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseQueue:
+    """
+    リースファイルによるワークキュー
+    ジョブの確保は O_CREAT|O_EXCL によるリースファイル作成で排他し、
+    TTLを過ぎても更新されないリース（停止したノード）は他ノードが回収する
+    """
+
+    def __init__(self, queue_dir: Path, node_id: Optional[str] = None,
+                 lease_ttl: float = DEFAULT_LEASE_TTL):
+        self.queue_dir = Path(queue_dir)
+        self.node_id = node_id or default_node_id()
+        self.lease_ttl = lease_ttl
+        self.lease_dir = self.queue_dir / 'leases'
+        self.done_dir = self.queue_dir / 'done'
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.done_dir.mkdir(parents=True, exist_ok=True)
+
+        # このノードが保持中のリース（入力パス -> アイテムID）
+        self.held: Dict[str, str] = {}
+        # このノードが確保した累計件数
+        self.claimed_count = 0
+        self._lock = threading.Lock()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # --- アイテム ---
+
+    @staticmethod
+    def item_id(key: str) -> str:
+        """ノード間で共通のアイテムID（入力ディレクトリからの相対パスで決定）"""
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _lease_path(self, item_id: str) -> Path:
+        return self.lease_dir / f"{item_id}{LEASE_SUFFIX}"
+
+    def _done_path(self, item_id: str) -> Path:
+        return self.done_dir / f"{item_id}.json"
+
+    def is_done(self, item_id: str) -> bool:
+        return self._done_path(item_id).exists()
+
+    # --- リース ---
+
+    def _server_now(self) -> float:
+        """
+        共有ファイルシステム側の現在時刻
+        ノード間の時計のずれを避けるため、ファイルを更新してそのmtimeを使う
+        """
+        clock = self.queue_dir / f".clock-{self.node_id}"
+        clock.touch()
+        return clock.stat().st_mtime
+
+    def _try_create_lease(self, item_id: str) -> bool:
+        try:
+            fd = os.open(self._lease_path(item_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'node': self.node_id, 'token': uuid.uuid4().hex,
+                       'claimed_at': time.time()}, f)
+        return True
+
+    @staticmethod
+    def _lease_state(path: Path):
+        """リースの (mtime, 内容)。内容にはリースごとに一意な token を含む"""
+        stat = path.stat()
+        return stat.st_mtime, path.read_bytes()
+
+    def _reclaim_expired(self, item_id: str, now: float) -> bool:
+        """期限切れリースを回収。回収できた場合True"""
+        lease_path = self._lease_path(item_id)
+        try:
+            stale_state = self._lease_state(lease_path)
+        except OSError:
+            # 既に解放されている
+            return True
+        if now - stale_state[0] <= self.lease_ttl:
+            return False
+
+        # 直前にもう一度確認し、その間に作り直された・更新されたリースは移動しない
+        try:
+            if self._lease_state(lease_path) != stale_state:
+                return False
+        except OSError:
+            return True
+
+        # renameは1ノードだけが成功する
+        expired_path = lease_path.with_name(f"{lease_path.name}.expired-{uuid.uuid4().hex}")
+        try:
+            os.rename(lease_path, expired_path)
+        except OSError:
+            return False
+
+        # 確認とrenameの間に別ノードが作り直した新しいリースを掴んだ場合は元に戻す
+        try:
+            if self._lease_state(expired_path) != stale_state:
+                try:
+                    os.link(expired_path, lease_path)
+                except OSError as e:
+                    # さらに別ノードがリースを作成済み。元の保持ノードはリースを失っている
+                    logger.warning(f"回収したリースを元に戻せません（二重処理の可能性）: {item_id} - {e}")
+                return False
+        except OSError:
+            return False
+        finally:
+            try:
+                expired_path.unlink()
+            except OSError:
+                pass
+
+        logger.warning(f"期限切れリースを回収: {item_id}")
+        return True
+
+    def claim(self, item_id: str, now: Optional[float] = None) -> bool:
+        """
+        アイテムを確保。既に完了済み・他ノードが処理中ならFalse
+        now: 期限切れ判定に使う共有ファイルシステムの時刻（省略時は取得する）
+        """
+        if self.is_done(item_id):
+            return False
+        if not self._try_create_lease(item_id):
+            if now is None:
+                now = self._server_now()
+            if not self._reclaim_expired(item_id, now):
+                return False
+            if not self._try_create_lease(item_id):
+                return False
+        # 確保前に他ノードが完了させていた場合は解放
+        if self.is_done(item_id):
+            self._release_lease(item_id)
+            return False
+        return True
+
+    def _release_lease(self, item_id: str):
+        try:
+            self._lease_path(item_id).unlink()
+        except OSError:
+            pass
+
+    def renew(self):
+        """保持中のリースのmtimeを更新"""
+        with self._lock:
+            item_ids = list(self.held.values())
+        for item_id in item_ids:
+            try:
+                os.utime(self._lease_path(item_id))
+            except OSError as e:
+                logger.warning(f"リースの更新に失敗: {item_id} - {e}")
+
+    def _heartbeat_loop(self):
+        interval = max(1.0, self.lease_ttl / 3)
+        while not self._heartbeat_stop.wait(interval):
+            self.renew()
+
+    def __enter__(self):
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._heartbeat_stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        # 未完了のリースは解放して他ノードに渡す
+        with self._lock:
+            item_ids = list(self.held.values())
+            self.held.clear()
+        for item_id in item_ids:
+            self._release_lease(item_id)
+        try:
+            (self.queue_dir / f".clock-{self.node_id}").unlink()
+        except OSError:
+            pass
+
+    # --- ジョブ ---
+
+    def claim_jobs(self, jobs: List[BatchJob], base_dir: Path) -> Iterator[BatchJob]:
+        """
+        ジョブを1件ずつ確保しながら返す（1巡のみ、待機しない）
+        スケジューラが投入する時点で確保するため、先取りしすぎない
+        """
+        # 共有ファイルシステムの時刻は1巡につき1回だけ取得する
+        # （巡回中に古くなっても、期限切れの判定が遅れるだけで安全側）
+        now = self._server_now()
+        for job in jobs:
+            item_id = self.item_id(job.input_path.relative_to(base_dir).as_posix())
+            if self.claim(item_id, now):
+                with self._lock:
+                    self.held[str(job.input_path)] = item_id
+                    self.claimed_count += 1
+                yield job
+
+    def complete(self, result: JobResult):
+        """結果を記録してリースを解放"""
+        with self._lock:
+            item_id = self.held.pop(result.input_path, None)
+        if item_id is None:
+            return
+
+        record = {
+            'input_path': result.input_path,
+            'output_path': result.output_path,
+            'success': result.success,
+            'error': result.error,
+            'elapsed': result.elapsed,
+            'node': self.node_id,
+            'worker_pid': result.worker_pid,
+        }
+        done_path = self._done_path(item_id)
+        tmp_path = done_path.with_name(f".{done_path.name}.{self.node_id}.tmp")
+        # 完了時刻は記録しない（merge_report は完了記録のmtimeを使う）
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, done_path)
+        self._release_lease(item_id)
+
+    def pending(self, jobs: List[BatchJob], base_dir: Path) -> int:
+        """未完了のジョブ数（他ノードが処理中のものを含む）"""
+        return sum(1 for job in jobs
+                   if not self.is_done(self.item_id(job.input_path.relative_to(base_dir).as_posix())))
+
+    def unclaimed(self, jobs: List[BatchJob], base_dir: Path) -> int:
+        """未完了かつどのノードもリースを持っていないジョブ数（ディレクトリを1回ずつ読む）"""
+        done = {name[:-len('.json')] for name in os.listdir(self.done_dir) if name.endswith('.json')}
+        leased = {name[:-len(LEASE_SUFFIX)] for name in os.listdir(self.lease_dir)
+                  if name.endswith(LEASE_SUFFIX)}
+        busy = done | leased
+        return sum(1 for job in jobs
+                   if self.item_id(job.input_path.relative_to(base_dir).as_posix()) not in busy)
+
+    # --- レポート ---
+
+    def merge_report(self) -> dict:
+        """全ノードの完了記録をマージしたレポートを作成して保存"""
+        nodes: Dict[str, dict] = {}
+        success_count = 0
+        error_count = 0
+        busy_seconds = 0.0
+        started = []
+        finished = []
+
+        for done_file in self.done_dir.glob('*.json'):
+            try:
+                with open(done_file, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                # ノード間の時計のずれを避けるため、完了時刻は共有ファイルシステムのmtime
+                finished_at = done_file.stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            node = nodes.setdefault(record['node'], {'success': 0, 'failed': 0, 'busy_seconds': 0.0})
+            if record['success']:
+                success_count += 1
+                node['success'] += 1
+            else:
+                error_count += 1
+                node['failed'] += 1
+            node['busy_seconds'] += record.get('elapsed', 0.0)
+            busy_seconds += record.get('elapsed', 0.0)
+            started.append(finished_at - record.get('elapsed', 0.0))
+            finished.append(finished_at)
+
+        wall_seconds = max(finished) - min(started) if finished else 0.0
+
+        report = {
+            'success': success_count,
+            'failed': error_count,
+            'nodes': nodes,
+            'busy_seconds': busy_seconds,
+            'wall_seconds': wall_seconds,
+            'images_per_second': (success_count + error_count) / wall_seconds if wall_seconds else 0.0,
+        }
+        tmp_path = self.queue_dir / f".report.{self.node_id}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.queue_dir / 'report.json')
+        return report
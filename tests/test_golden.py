@@ -0,0 +1,89 @@
+"""
+モザイク適用のゴールデン画像テスト
+input/ の画像に固定の領域でモザイクをかけ、保存済みの参照画像とピクセル単位で比較する
+検出（MediaPipe）は使わないため、検出モデルの差異に影響されない
+
+参照画像は領域ごとのぼかし範囲を含む切り出しのみを保存し、それ以外の画素は元画像と一致することを確認する
+参照画像の作り直し: GOLDEN_UPDATE=1 python -m pytest tests/test_golden.py
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+from src.metadata import mosaic_size_for_dimensions
+from src.mosaic_processor import PROFILES, apply_mosaic
+
+ROOT = Path(__file__).resolve().parent.parent
+INPUT_DIR = ROOT / 'input'
+GOLDEN_DIR = Path(__file__).resolve().parent / 'golden'
+UPDATE = os.environ.get('GOLDEN_UPDATE') == '1'
+
+# ぼかしが領域外に及ぶ最大幅（four_edge は最大5px、two_edge は3px）より広く切り出す
+CROP_PADDING = 8
+
+# 画像に対する割合 (x_min, y_min, x_max, y_max)
+# 内側の矩形と、下端まで届く矩形（検出結果の腰から下の領域に相当）
+FIXED_AREAS = (
+    (0.30, 0.30, 0.50, 0.40),
+    (0.45, 0.85, 0.65, 1.00),
+)
+
+IMAGES = sorted(INPUT_DIR.glob('*.png'))
+
+
+def _areas_for(image):
+    height, width = image.shape[:2]
+    areas = []
+    for x0, y0, x1, y1 in FIXED_AREAS:
+        left, top = int(width * x0), int(height * y0)
+        right, bottom = int(width * x1), int(height * y1)
+        areas.append(np.array([[left, top], [right, top], [right, bottom], [left, bottom]],
+                              dtype=np.int32))
+    return areas
+
+
+def _crop_box(image, area):
+    height, width = image.shape[:2]
+    return (max(0, area[:, 1].min() - CROP_PADDING), min(height, area[:, 1].max() + CROP_PADDING),
+            max(0, area[:, 0].min() - CROP_PADDING), min(width, area[:, 0].max() + CROP_PADDING))
+
+
+@pytest.mark.parametrize('profile', sorted(PROFILES))
+@pytest.mark.parametrize('image_path', IMAGES, ids=lambda path: path.stem)
+def test_apply_mosaic_matches_golden(profile, image_path):
+    image = cv2.imread(str(image_path))
+    height, width = image.shape[:2]
+    areas = _areas_for(image)
+
+    result = apply_mosaic(image, areas, mosaic_size_for_dimensions(width, height),
+                          PROFILES[profile].blur_mode)
+
+    untouched = np.ones((height, width), dtype=bool)
+    for index, area in enumerate(areas):
+        top, bottom, left, right = _crop_box(image, area)
+        untouched[top:bottom, left:right] = False
+        crop = result[top:bottom, left:right]
+        reference_path = GOLDEN_DIR / profile / f"{image_path.stem}_{index}.png"
+
+        if UPDATE:
+            reference_path.parent.mkdir(parents=True, exist_ok=True)
+            assert cv2.imwrite(str(reference_path), crop)
+            continue
+
+        assert reference_path.exists(), f"参照画像がありません: {reference_path}"
+        reference = cv2.imread(str(reference_path))
+        assert reference.shape == crop.shape
+        diff = cv2.absdiff(crop, reference).max(axis=2)
+        assert np.count_nonzero(diff) == 0, f"{reference_path.name}: 最大差分 {diff.max()}"
+
+    # 切り出し範囲の外はモザイク・ぼかしの影響を受けない
+    assert np.array_equal(result[untouched], image[untouched])
+    # 下端の行までモザイクがかかる
+    bottom_area = areas[1]
+    left, right = bottom_area[:, 0].min(), bottom_area[:, 0].max()
+    assert not np.array_equal(result[-1, left:right], image[-1, left:right])
@@ -0,0 +1,62 @@
+"""
+ヘッダーのみのメタデータ取得のテスト
+"""
+
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageFile
+
+from src.metadata import mosaic_size_for_dimensions, probe_image
+
+INPUT_DIR = Path(__file__).resolve().parent.parent / 'input'
+
+
+@pytest.fixture
+def load_calls(monkeypatch):
+    """ピクセルのデコード（load() 呼び出し）を記録"""
+    calls = []
+    original = ImageFile.ImageFile.load
+
+    def record(self):
+        calls.append(self)
+        return original(self)
+
+    monkeypatch.setattr(ImageFile.ImageFile, 'load', record)
+    return calls
+
+
+@pytest.mark.parametrize('image_path', sorted(INPUT_DIR.glob('*.png')), ids=lambda p: p.name)
+def test_probe_does_not_decode_pixels(load_calls, image_path):
+    metadata = probe_image(image_path)
+    assert load_calls == []
+    assert metadata is not None
+    assert metadata.format == 'PNG'
+    assert metadata.width > 0 and metadata.height > 0
+
+
+@pytest.mark.parametrize('fmt, suffix', [('PNG', '.png'), ('JPEG', '.jpg')])
+def test_probe_reads_orientation_from_header(tmp_path, fmt, suffix):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = tmp_path / f"rotated{suffix}"
+    Image.new('RGB', (600, 400)).save(path, fmt, exif=exif)
+
+    metadata = probe_image(path)
+    assert metadata.orientation == 6
+    assert metadata.oriented_size == (400, 600)
+
+
+def test_probe_unreadable_file(tmp_path):
+    path = tmp_path / 'broken.png'
+    path.write_bytes(b'not an image')
+    assert probe_image(path) is None
+
+
+@pytest.mark.parametrize('width, height, expected', [
+    (300, 200, 4),
+    (1824, 1248, 18),
+    (1248, 1824, 18),
+])
+def test_mosaic_size_for_dimensions(width, height, expected):
+    assert mosaic_size_for_dimensions(width, height) == expected
@@ -0,0 +1,60 @@
+"""
+検出領域のスケール戻しのテスト
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from src.mosaic_processor import PROFILES, scale_areas
+
+
+def _thumbnail_area(left, right, top, bottom):
+    return np.array([[left, top], [right, top], [right, bottom], [left, bottom]], dtype=np.int32)
+
+
+@pytest.mark.parametrize('profile', sorted(PROFILES))
+def test_scale_areas_snaps_bottom_edge(profile):
+    # 1824x1248 を長辺1024/800に縮小した際の下端は、切り捨てで元画像の最終行に届かない
+    width, height = 1824, 1248
+    limit = PROFILES[profile].max_image_size
+    scale = min(limit / height, limit / width)
+    thumbnail_height = int(height * scale)
+    assert int(thumbnail_height / scale) < height
+
+    [area] = scale_areas([_thumbnail_area(300, 500, 200, thumbnail_height)],
+                         scale, (width, height), PROFILES[profile])
+
+    assert list(area[:, 1]) == [int(200 / scale), int(200 / scale), height, height]
+
+
+def test_scale_areas_applies_original_margin():
+    profile = PROFILES['streamlit']
+    assert profile.margin_space == 'original'
+    scale = 0.5
+
+    [area] = scale_areas([_thumbnail_area(100, 200, 50, 150)], scale, (1000, 400), profile)
+
+    margin = profile.area_margin
+    assert list(area[:, 0]) == [200 - margin, 400 + margin, 400 + margin, 200 - margin]
+    assert list(area[:, 1]) == [100, 100, 300, 300]
+
+
+def test_scale_areas_keeps_detection_margin_scaled():
+    # 'detection' のマージンは縮小画像上で加えられるため、ここでは倍率分だけ拡大される
+    profile = PROFILES['render']
+    assert profile.margin_space == 'detection'
+
+    [area] = scale_areas([_thumbnail_area(80, 220, 50, 150)], 0.5, (1000, 400), profile)
+
+    assert list(area[:, 0]) == [160, 440, 440, 160]
+
+
+def test_scale_areas_without_resize():
+    area = _thumbnail_area(10, 20, 5, 30)
+
+    [scaled] = scale_areas([area], 1.0, (40, 30), PROFILES['render'])
+
+    assert np.array_equal(scaled, area)
+    assert scaled is not area
@@ -0,0 +1,85 @@
+"""
+進捗・スループット表示のテスト
+"""
+
+import io
+import json
+import itertools
+from types import SimpleNamespace
+
+from src.progress import ProgressReporter
+from src.scheduler import BatchJob, JobResult
+from src.work_queue import LeaseQueue
+
+
+def _scheduler(submitted=0, memory_wait=0, in_flight=0):
+    return SimpleNamespace(stats={'submitted': submitted, 'memory_wait': memory_wait,
+                                  'in_flight': in_flight})
+
+
+def test_total_follows_claimed_count():
+    claimed = [2]
+    reporter = ProgressReporter(lambda: claimed[0], _scheduler(submitted=2, in_flight=2),
+                                'json', stream=io.StringIO())
+    assert reporter.snapshot()['total'] == 2
+    claimed[0] = 5
+    snapshot = reporter.snapshot()
+    assert snapshot['total'] == 5
+    assert snapshot['queue']['pending'] == 3
+
+
+def test_queue_total_includes_unclaimed_items(tmp_path):
+    # 投入時に確保するため、途中では大半のアイテムが未確保のまま残っている
+    base_dir = tmp_path / 'input'
+    jobs = [BatchJob(base_dir / f"page{i:02d}.png", tmp_path / 'out' / f"page{i:02d}.png")
+            for i in range(20)]
+    queue = LeaseQueue(tmp_path / 'queue', 'node')
+    other = LeaseQueue(tmp_path / 'queue', 'other')
+    assert list(other.claim_jobs(jobs[-2:], base_dir)) == jobs[-2:]
+
+    scheduler = _scheduler()
+    reporter = ProgressReporter(lambda: queue.claimed_count + queue.unclaimed(jobs, base_dir),
+                                scheduler, 'json', stream=io.StringIO())
+    for job in itertools.islice(queue.claim_jobs(jobs, base_dir), 4):
+        scheduler.stats['submitted'] += 1
+    for job in jobs[:2]:
+        result = JobResult(str(job.input_path), str(job.output_path), True, worker_pid=1)
+        queue.complete(result)
+        reporter.record(result)
+
+    snapshot = reporter.snapshot()
+    # 他ノードが処理中の2件を除く18件がこのノードの母数
+    assert snapshot['total'] == 18
+    assert snapshot['completed'] == 2
+    assert snapshot['queue']['pending'] == 14
+    assert snapshot['eta_seconds'] > 0
+
+
+def test_results_without_worker_are_not_utilisation():
+    reporter = ProgressReporter(2, _scheduler(submitted=2), 'json', stream=io.StringIO())
+    reporter.record(JobResult('a.png', 'a_out.png', True, elapsed=0.5, worker_pid=7))
+    reporter.record(JobResult('b.png', 'b_out.png', False, 'ワーカーが異常終了しました'))
+    assert set(reporter.snapshot()['worker_utilisation']) == {'7'}
+
+
+def test_memory_wait_is_a_job_count_capped_by_pending():
+    reporter = ProgressReporter(10, _scheduler(submitted=8, memory_wait=3, in_flight=1),
+                                'json', stream=io.StringIO())
+    assert reporter.snapshot()['queue']['memory_wait'] == 2
+
+
+def test_json_summary_event():
+    stream = io.StringIO()
+    scheduler = _scheduler()
+    with ProgressReporter(2, scheduler, 'json', interval=60, stream=stream) as reporter:
+        scheduler.stats['submitted'] = 2
+        reporter.record(JobResult('a.png', 'a_out.png', True, elapsed=0.1, worker_pid=1,
+                                  input_bytes=1024 ** 2))
+        reporter.record(JobResult('b.png', 'b_out.png', False, elapsed=0.1, worker_pid=2))
+
+    [line] = stream.getvalue().splitlines()
+    summary = json.loads(line)
+    assert summary['event'] == 'summary'
+    assert (summary['completed'], summary['succeeded'], summary['failed']) == (2, 1, 1)
+    assert summary['eta_seconds'] == 0
+    assert set(summary['worker_utilisation']) == {'1', '2'}
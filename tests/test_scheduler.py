@@ -0,0 +1,111 @@
+"""
+スケジューラのリソース計画のテスト
+"""
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from src.scheduler import (BatchJob, BatchScheduler, JobResult, ResourceLimits, SchedulePlan,
+                           parse_size, plan_resources)
+from src.triage import load_failures
+
+GIB = 1024 ** 3
+
+
+def test_worker_threads_use_every_core():
+    plan = plan_resources(5, 16 * GIB, ResourceLimits(cpu_count=8, memory_bytes=32 * GIB))
+    assert plan.worker_threads == [2, 2, 2, 1, 1]
+    assert sum(plan.worker_threads) == 8
+    assert plan.threads_label == '1-2'
+
+
+def test_worker_threads_when_oversubscribed():
+    plan = plan_resources(4, 16 * GIB, ResourceLimits(cpu_count=2, memory_bytes=32 * GIB))
+    assert plan.worker_threads == [1, 1, 1, 1]
+
+
+def test_auto_workers_limited_by_memory():
+    plan = plan_resources(0, 2 * GIB, ResourceLimits(cpu_count=16, memory_bytes=32 * GIB))
+    assert plan.workers == 3
+    assert sum(plan.worker_threads) == 16
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('512M', 512 * 1024 ** 2),
+    ('2G', 2 * GIB),
+    ('1.5GiB', int(1.5 * GIB)),
+    ('1024', 1024),
+])
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize('text', ['inf', 'nan', '-1G', 'abc', '0'])
+def test_parse_size_rejects_invalid(text):
+    with pytest.raises(ValueError):
+        parse_size(text)
+
+
+def _init_stub_worker(*args):
+    """検出モデルを読み込まないワーカー初期化"""
+
+
+def _exit_on_crash(input_path, output_path, error_dir=None):
+    """名前に crash を含む画像でワーカーを異常終了させる"""
+    if 'crash' in Path(input_path).name:
+        os._exit(1)
+    time.sleep(0.05)
+    return JobResult(input_path, output_path, True, elapsed=0.05, worker_pid=os.getpid())
+
+
+def _always_exit(input_path, output_path, error_dir=None):
+    os._exit(1)
+
+
+class _StubScheduler(BatchScheduler):
+    worker_initializer = staticmethod(_init_stub_worker)
+    job_runner = staticmethod(_exit_on_crash)
+
+
+class _AlwaysCrashScheduler(_StubScheduler):
+    job_runner = staticmethod(_always_exit)
+
+
+def _crash_jobs(tmp_path, names):
+    return [BatchJob(tmp_path / name, tmp_path / 'out' / name) for name in names]
+
+
+def _pool_plan(workers=2):
+    return SchedulePlan(workers=workers, threads_per_worker=1, memory_budget=64 * GIB)
+
+
+def test_worker_crash_restarts_pool(tmp_path):
+    names = ['a.png', 'b.png', 'crash.png', 'c.png', 'd.png', 'e.png']
+    jobs = _crash_jobs(tmp_path, names)
+    scheduler = _StubScheduler(_pool_plan(), error_dir=tmp_path / 'errors')
+
+    results = {Path(result.input_path).name: result for result in scheduler.run(jobs)}
+
+    assert sorted(results) == sorted(names)
+    assert [name for name, result in results.items() if not result.success] == ['crash.png']
+    # 原因のジョブのみエラーディレクトリに保存される
+    [record] = load_failures(tmp_path / 'errors')
+    assert Path(record.input_path).name == 'crash.png'
+    assert record.reason == 'worker_crashed'
+    assert scheduler.stats['submitted'] == len(names)
+
+
+def test_repeated_worker_crashes_fail_remaining_jobs(tmp_path):
+    names = [f"page{i}.png" for i in range(8)]
+    jobs = _crash_jobs(tmp_path, names)
+    scheduler = _AlwaysCrashScheduler(_pool_plan(), error_dir=tmp_path / 'errors')
+
+    results = list(scheduler.run(jobs))
+
+    assert sorted(Path(result.input_path).name for result in results) == names
+    assert not any(result.success for result in results)
+    assert len(load_failures(tmp_path / 'errors')) == len(names)
+    assert scheduler.stats['submitted'] == len(names)
@@ -0,0 +1,48 @@
+"""
+失敗画像トリアージの保存・読み込みのテスト
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from src.triage import LANDMARKS_FILE, load_failures, save_failure
+
+
+def test_save_and_load_failure_with_detection(tmp_path):
+    source = tmp_path / 'page.png'
+    source.write_bytes(b'original')
+    detection = {
+        'thumbnail': np.zeros((32, 48, 3), dtype=np.uint8),
+        'scale': 0.5,
+        'original_size': (96, 64),
+        'landmarks': [{'name': 'LEFT_HIP', 'x': 0.4, 'y': 0.6, 'z': 0.0, 'visibility': 0.1}],
+    }
+
+    record = save_failure(tmp_path / 'errors', str(source), str(tmp_path / 'out.png'),
+                          'no_detection', detection)
+
+    [loaded] = load_failures(tmp_path / 'errors')
+    assert loaded == record
+    assert loaded.reason == 'no_detection'
+    assert loaded.scale == 0.5
+    assert loaded.original_size == [96, 64]
+    assert Path(loaded.thumbnail).exists()
+    assert Path(loaded.original_copy).read_bytes() == b'original'
+    with open(loaded.entry_dir / LANDMARKS_FILE, encoding='utf-8') as f:
+        assert json.load(f)[0]['name'] == 'LEFT_HIP'
+
+
+def test_save_failure_without_detection(tmp_path):
+    source = tmp_path / 'page.png'
+    source.write_bytes(b'original')
+
+    save_failure(tmp_path / 'errors', str(source), str(tmp_path / 'out.png'), 'worker_crashed')
+
+    [loaded] = load_failures(tmp_path / 'errors')
+    assert loaded.reason == 'worker_crashed'
+    assert loaded.thumbnail is None
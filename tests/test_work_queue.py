@@ -0,0 +1,157 @@
+"""
+リースファイルによる分散ワークキューのテスト
+"""
+
+import os
+import json
+import multiprocessing
+from pathlib import Path
+
+from src.scheduler import BatchJob, JobResult
+from src.work_queue import LeaseQueue
+
+BASE_DIR = Path('/catalogue')
+
+
+def _jobs(count):
+    return [BatchJob(BASE_DIR / f"page{i:03d}.png", Path('/out') / f"page{i:03d}.png")
+            for i in range(count)]
+
+
+def _result(job, success=True, elapsed=0.5):
+    return JobResult(str(job.input_path), str(job.output_path), success, elapsed=elapsed)
+
+
+def _node_main(queue_dir, node_id, count, results):
+    """子プロセスのノード: 確保できたジョブを完了させて一覧を返す"""
+    claimed = []
+    with LeaseQueue(Path(queue_dir), node_id) as queue:
+        for job in queue.claim_jobs(_jobs(count), BASE_DIR):
+            claimed.append(job.input_path.name)
+            queue.complete(_result(job))
+    results.put((node_id, claimed))
+
+
+def test_multi_process_claims_are_exclusive(tmp_path):
+    count = 60
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    nodes = [context.Process(target=_node_main, args=(str(tmp_path), f"node{i}", count, results))
+             for i in range(4)]
+    for node in nodes:
+        node.start()
+    claimed = dict(results.get(timeout=60) for _ in nodes)
+    for node in nodes:
+        node.join(timeout=60)
+
+    names = [name for node_claims in claimed.values() for name in node_claims]
+    assert len(names) == count
+    assert set(names) == {job.input_path.name for job in _jobs(count)}
+    assert LeaseQueue(tmp_path).pending(_jobs(count), BASE_DIR) == 0
+    assert list((tmp_path / 'leases').iterdir()) == []
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    job = _jobs(1)[0]
+    dead = LeaseQueue(tmp_path, 'dead', lease_ttl=60)
+    assert list(dead.claim_jobs([job], BASE_DIR)) == [job]
+
+    survivor = LeaseQueue(tmp_path, 'survivor', lease_ttl=60)
+    # 有効なリースは奪わない
+    assert list(survivor.claim_jobs([job], BASE_DIR)) == []
+
+    # ハートビートが止まってTTLを過ぎたリースは回収する
+    lease = next((tmp_path / 'leases').iterdir())
+    expired = lease.stat().st_mtime - 120
+    os.utime(lease, (expired, expired))
+    assert list(survivor.claim_jobs([job], BASE_DIR)) == [job]
+    survivor.complete(_result(job))
+
+    with open(next((tmp_path / 'done').iterdir()), encoding='utf-8') as f:
+        assert json.load(f)['node'] == 'survivor'
+
+
+def test_done_items_are_not_claimed_again(tmp_path):
+    jobs = _jobs(3)
+    first = LeaseQueue(tmp_path, 'first')
+    for job in first.claim_jobs(jobs, BASE_DIR):
+        first.complete(_result(job))
+
+    second = LeaseQueue(tmp_path, 'second')
+    assert list(second.claim_jobs(jobs, BASE_DIR)) == []
+    assert second.pending(jobs, BASE_DIR) == 0
+
+
+def test_server_time_is_read_once_per_pass(tmp_path, monkeypatch):
+    jobs = _jobs(20)
+    holder = LeaseQueue(tmp_path, 'holder')
+    assert len(list(holder.claim_jobs(jobs, BASE_DIR))) == len(jobs)
+
+    other = LeaseQueue(tmp_path, 'other')
+    calls = []
+    original = other._server_now
+    monkeypatch.setattr(other, '_server_now', lambda: calls.append(1) or original())
+    assert list(other.claim_jobs(jobs, BASE_DIR)) == []
+    assert len(calls) == 1
+
+
+def test_merge_report_totals(tmp_path):
+    jobs = _jobs(5)
+    node_a = LeaseQueue(tmp_path, 'node-a')
+    node_b = LeaseQueue(tmp_path, 'node-b')
+    claimed_a = list(node_a.claim_jobs(jobs[:3], BASE_DIR))
+    claimed_b = list(node_b.claim_jobs(jobs[3:], BASE_DIR))
+    node_a.complete(_result(claimed_a[0]))
+    node_a.complete(_result(claimed_a[1]))
+    node_a.complete(_result(claimed_a[2], success=False))
+    for job in claimed_b:
+        node_b.complete(_result(job, elapsed=1.0))
+
+    report = node_b.merge_report()
+    assert report['success'] == 4
+    assert report['failed'] == 1
+    assert report['nodes']['node-a'] == {'success': 2, 'failed': 1, 'busy_seconds': 1.5}
+    assert report['nodes']['node-b'] == {'success': 2, 'failed': 0, 'busy_seconds': 2.0}
+    assert report['busy_seconds'] == 3.5
+    with open(tmp_path / 'report.json', encoding='utf-8') as f:
+        assert json.load(f) == report
+
+
+def test_merge_report_uses_filesystem_time(tmp_path):
+    jobs = _jobs(2)
+    node = LeaseQueue(tmp_path, 'node')
+    for job in node.claim_jobs(jobs, BASE_DIR):
+        node.complete(_result(job, elapsed=2.0))
+    # 完了記録のmtime（共有ファイルシステムの時刻）から経過時間を求める
+    for done_file, finished_at in zip(sorted((tmp_path / 'done').iterdir()), (1000.0, 1010.0)):
+        os.utime(done_file, (finished_at, finished_at))
+
+    report = node.merge_report()
+    assert report['wall_seconds'] == 12.0
+    assert report['images_per_second'] == 2 / 12.0
+
+
+def test_live_lease_is_not_moved(tmp_path, monkeypatch):
+    job = _jobs(1)[0]
+    holder = LeaseQueue(tmp_path, 'holder', lease_ttl=60)
+    assert list(holder.claim_jobs([job], BASE_DIR)) == [job]
+    [lease] = (tmp_path / 'leases').iterdir()
+    os.utime(lease, (0, 0))
+
+    # 期限切れの確認後、rename の前に保持ノードがハートビートでリースを更新した場合
+    other = LeaseQueue(tmp_path, 'other', lease_ttl=60)
+    states = iter([None])
+    original = LeaseQueue._lease_state
+
+    def renewed_before_rename(path):
+        state = original(path)
+        if next(states, 'renewed') == 'renewed':
+            holder.renew()
+            state = original(path)
+        return state
+
+    monkeypatch.setattr(LeaseQueue, '_lease_state', staticmethod(renewed_before_rename))
+    assert list(other.claim_jobs([job], BASE_DIR)) == []
+    assert lease.exists()
+    with open(lease, encoding='utf-8') as f:
+        assert json.load(f)['node'] == 'holder'